@@ -1,6 +1,7 @@
 from google.adk.agents import LlmAgent
 from quote_agent.prompts import root_instructions
 #from quote_agent.agents.intent import intent_agent
+from quote_agent.agents.intent import route_intent_fast_path
 from quote_agent.agents.orders import order_agent
 from quote_agent.agents.bundles import bundle_agent
 from quote_agent.agents.negotiation import negotiation_agent
@@ -21,4 +22,6 @@ root_agent = LlmAgent(
         negotiation_agent,
     ],
     before_agent_callback=preload_agent_context,
+    # Clear intents are transferred locally; only ambiguous ones reach the model
+    before_model_callback=route_intent_fast_path,
 )
@@ -1,6 +1,13 @@
 from google.adk.agents import LlmAgent
 #from quote_agent.prompts import intent_instructions
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, FunctionCall, Part
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import math
+import os
+import re
 
 INTENT_LABELS = [
     "order_reorder", "bundle_suggestion", "quote_request", "catalog_lookup",
@@ -14,3 +21,212 @@ intent_agent = LlmAgent(
     "Classifies user intent for routing (e.g. reorder, bundle, quote).",
     instruction="",
     output_key="user_intent")
+
+# Sub-agent each intent is dispatched to; "other" always goes to the LLM
+INTENT_ROUTES = {
+    "order_reorder": "order_agent",
+    "order_history": "order_agent",
+    "bundle_suggestion": "bundle_agent",
+    "quote_request": "negotiation_agent",
+    "catalog_lookup": "negotiation_agent",
+}
+INTENT_ROUTER_THRESHOLD = float(
+    os.environ.get("INTENT_ROUTER_THRESHOLD", "0.8"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9%]+")
+
+# (label, pattern, confidence) – mirrors the routing rules in the root prompt
+INTENT_RULES = [
+    ("order_reorder",
+     re.compile(
+         r"\b(re-?order|order (it|that|them|those) again|buy (it|that|them) again"
+         r"|repeat (my |the )?(last |previous )?order"
+         r"|same as (last time|my last order|before))\b"), 0.95),
+    # Only unmistakable history lookups; "my order" alone also shows up in
+    # pricing requests
+    ("order_history",
+     re.compile(
+         r"\b(order history|(past|previous|recent) orders"
+         r"|(show|list|see) (me )?(my |our )?(past |previous |recent )?orders"
+         r"|orders? #?\d+\s*(-|to)\s*\d+|last \d+ orders"
+         r"|what (was|were) (my|our) last orders?"
+         r"|past purchases|what did (i|we) (buy|order))\b"), 0.9),
+    ("quote_request",
+     re.compile(r"(\b\d+(\.\d+)?\s*%|\bpercent\b|\bdiscount|\bquote\b"
+                r"|\bnegotiat|\bapprov|\bcheaper\b|\bbest price\b"
+                r"|\bbetter (price|deal|rate)\b|\bdeals?\b"
+                r"|\bbulk (price|pricing|deal)\b)"), 0.9),
+    ("bundle_suggestion",
+     re.compile(r"\b(bundles?|kits?|other gear|related (items|products)"
+                r"|goes? (well )?with|what else|accessor(y|ies)"
+                r"|for (a|my|the|our) project|complement\w*)\b"), 0.9),
+    ("catalog_lookup",
+     re.compile(r"\b(how much (is|are|does|do)|price (of|for)|in stock"
+                r"|sku|do you (have|sell|stock))\b"), 0.85),
+]
+
+# A reference to a past order; alongside a pricing or catalog rule it is
+# ambiguous ("what's the price of my last order"), so the LLM decides
+ORDER_REFERENCE_RE = re.compile(
+    r"\b((my|our) ((last|previous|latest|recent) )?orders?"
+    r"|(last|previous) orders?|order #?\d+)\b")
+
+# Seed utterances for the fallback classifier
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "order_reorder": [
+        "reorder my last order", "order the same again",
+        "can we repeat last month's order", "place that order again",
+        "I need the same items as last time", "restock what we bought before"
+    ],
+    "order_history": [
+        "show my order history", "what was my last order",
+        "list my previous orders", "what did we buy last month",
+        "show orders 180 to 200", "products in my recent orders"
+    ],
+    "bundle_suggestion": [
+        "what else do I need for this project", "suggest a bundle",
+        "any accessories that go with this", "I need other gear for the job",
+        "recommend a kit for installing pipes", "related tools for this"
+    ],
+    "quote_request": [
+        "can I get 10% off", "I want a quote for these items",
+        "can you do a better price", "apply a discount to my order",
+        "we need approval for a bigger discount", "negotiate the price"
+    ],
+    "catalog_lookup": [
+        "how much is the copper pipe", "what is the price of this product",
+        "do you sell pipe fittings", "is this item in stock",
+        "look up the sku for the valve", "find the product details"
+    ],
+    "other": [
+        "hello", "thanks", "who are you", "what can you do", "good morning",
+        "that is all"
+    ],
+}
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class IntentClassifier:
+    """Multinomial naive Bayes over INTENT_LABELS, trained on seed examples.
+
+    It only scores messages the regex rules don't settle, so it stays tiny
+    and runs in microseconds without a model call.
+    """
+
+    def __init__(self, examples: Dict[str, List[str]], alpha: float = 1.0):
+        self.alpha = alpha
+        self._counts: Dict[str, Counter] = {}
+        self._totals: Dict[str, int] = {}
+        self._priors: Dict[str, float] = {}
+        vocab = set()
+        n_docs = sum(len(texts) for texts in examples.values())
+        for label, texts in examples.items():
+            counts = Counter(t for text in texts for t in _tokens(text))
+            self._counts[label] = counts
+            self._totals[label] = sum(counts.values())
+            self._priors[label] = math.log(len(texts) / n_docs)
+            vocab.update(counts)
+        self._vocab_size = len(vocab)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        tokens = _tokens(text)
+        scores = {}
+        for label, counts in self._counts.items():
+            denom = self._totals[label] + self.alpha * self._vocab_size
+            scores[label] = self._priors[label] + sum(
+                math.log((counts[t] + self.alpha) / denom) for t in tokens)
+        best = max(scores, key=scores.get)
+        # Softmax over log scores gives a posterior to gate on
+        top = scores[best]
+        norm = sum(math.exp(s - top) for s in scores.values())
+        return best, 1.0 / norm
+
+
+intent_classifier = IntentClassifier(INTENT_EXAMPLES)
+
+
+def classify_intent(text: str) -> Tuple[Optional[str], float]:
+    """Returns the most likely intent label and a confidence in [0, 1].
+
+    The label is None when rules for different agents both match (e.g. a
+    discount on a past order), or when a pricing or catalog rule matches a
+    message that refers to a past order, leaving the routing to the LLM.
+    """
+    lowered = (text or "").lower()
+    hits = {}
+    for label, pattern, confidence in INTENT_RULES:
+        if pattern.search(lowered):
+            hits[label] = max(hits.get(label, 0.0), confidence)
+
+    if hits:
+        routes = {INTENT_ROUTES.get(label) for label in hits}
+        if ORDER_REFERENCE_RE.search(lowered):
+            routes.add(INTENT_ROUTES["order_history"])
+        if len(routes) > 1:
+            return None, 0.0
+        label = max(hits, key=hits.get)
+        return label, hits[label]
+
+    return intent_classifier.predict(text)
+
+
+_router_stats = Counter()
+
+
+def router_stats() -> dict:
+    total = sum(_router_stats.values())
+    return {
+        **_router_stats, "fast_path_rate":
+        round(_router_stats["fast_path"] / total, 3) if total else 0.0
+    }
+
+
+def _latest_user_text(llm_request: LlmRequest) -> Optional[str]:
+    if not llm_request.contents:
+        return None
+    content = llm_request.contents[-1]
+    # Only route fresh user messages, not function responses
+    if content.role != "user" or any(p.function_response
+                                      for p in content.parts or []):
+        return None
+    text = " ".join(p.text for p in content.parts or [] if p.text)
+    return text or None
+
+
+def route_intent_fast_path(callback_context: CallbackContext,
+                           llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """Transfers clear requests straight to a sub-agent, skipping the LLM.
+
+    Returning an LlmResponse that carries a `transfer_to_agent` call makes
+    ADK run the transfer exactly as if the root model had chosen it. Low
+    confidence messages return None and fall through to the model.
+    """
+    text = _latest_user_text(llm_request)
+    if not text:
+        return None
+
+    label, confidence = classify_intent(text)
+    if label is None:
+        _router_stats["llm_fallback"] += 1
+        print("🤔 Message matches several intents; routing with the LLM.")
+        return None
+
+    callback_context.state["user_intent"] = label
+    agent_name = INTENT_ROUTES.get(label)
+    if agent_name is None or confidence < INTENT_ROUTER_THRESHOLD:
+        _router_stats["llm_fallback"] += 1
+        print(f"🤔 Intent '{label}' ({confidence:.2f}) unclear; "
+              f"routing with the LLM.")
+        return None
+
+    _router_stats["fast_path"] += 1
+    print(f"⚡ Intent '{label}' ({confidence:.2f}) → {agent_name}")
+    return LlmResponse(content=Content(
+        role="model",
+        parts=[
+            Part(function_call=FunctionCall(name="transfer_to_agent",
+                                            args={"agent_name": agent_name}))
+        ]))
@@ -4,6 +4,7 @@ from quote_agent.tools.bundling import find_product_id_by_name_tool
 from quote_agent.tools.create_discounted_order import create_multi_item_discounted_order_tool
 from quote_agent.tools.create_quote import create_combined_quote_request_tool_func
 from quote_agent.tools.catalog import get_price_by_product_id_tool
+from quote_agent.tools.discount_simulation import simulate_discount_scenarios_tool
 
 negotiation_agent = LlmAgent(
     name="negotiation_agent",
@@ -14,6 +15,6 @@ negotiation_agent = LlmAgent(
     tools=[
         create_multi_item_discounted_order_tool,
         create_combined_quote_request_tool_func, find_product_id_by_name_tool,
-        get_price_by_product_id_tool
+        get_price_by_product_id_tool, simulate_discount_scenarios_tool
     ],
 )
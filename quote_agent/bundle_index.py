@@ -0,0 +1,163 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from itertools import combinations
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+BUNDLE_INDEX_REFRESH_SECONDS = float(
+    os.environ.get("BUNDLE_INDEX_REFRESH_SECONDS", "3600"))
+# Custom fields whose shared values group products into bundles
+BUNDLE_GROUP_FIELDS = ("bundle_type", "project_type")
+# Weight of sharing a catalog group relative to a perfect co-purchase score
+BUNDLE_GROUP_WEIGHT = 0.3
+
+GroupKey = Tuple[str, str]
+
+
+def field_key(name: str) -> str:
+    """Normalises a custom field name, e.g. "Bundle Type" -> "bundle_type"."""
+    return re.sub(r"[^a-z0-9]+", "_", (name or "").lower()).strip("_")
+
+
+def product_groups(product: dict) -> List[GroupKey]:
+    return [(key, cf["value"])
+            for cf in product.get("custom_fields") or []
+            for key in (field_key(cf["name"]), )
+            if key in BUNDLE_GROUP_FIELDS and cf.get("value")]
+
+
+class BundleIndex:
+    """Co-purchase counts and catalog groups for ranking bundle complements.
+
+    Two products score higher the more often they were bought in the same
+    order (cosine-normalised, so best sellers don't dominate) and for every
+    bundle/project type group they share.
+    """
+
+    def __init__(self, baskets: Iterable[Iterable[int]] = (),
+                 products: Iterable[dict] = ()):
+        self.built_at = time.time()
+        self.order_count = 0
+        self.product_counts: Counter = Counter()
+        self.co_counts: Dict[int, Counter] = {}
+        for basket in baskets:
+            items = sorted(set(basket))
+            if not items:
+                continue
+            self.order_count += 1
+            self.product_counts.update(items)
+            for a, b in combinations(items, 2):
+                self.co_counts.setdefault(a, Counter())[b] += 1
+                self.co_counts.setdefault(b, Counter())[a] += 1
+
+        self.groups: Dict[GroupKey, Set[int]] = {}
+        self.product_group_keys: Dict[int, List[GroupKey]] = {}
+        for product in products:
+            keys = product_groups(product)
+            if keys:
+                self.product_group_keys[product["id"]] = keys
+                for key in keys:
+                    self.groups.setdefault(key, set()).add(product["id"])
+
+    def complements(self, product_ids: Iterable[int],
+                    k: int = 5) -> List[dict]:
+        seeds = {int(pid) for pid in product_ids}
+        scores: Dict[int, float] = {}
+        reasons: Dict[int, List[str]] = {}
+
+        for seed in seeds:
+            seed_count = self.product_counts.get(seed, 0)
+            for other, together in self.co_counts.get(seed, {}).items():
+                if other in seeds:
+                    continue
+                score = together / math.sqrt(seed_count *
+                                             self.product_counts[other])
+                scores[other] = scores.get(other, 0.0) + score
+                reasons.setdefault(other, []).append(
+                    f"bought with {seed} in {together} orders")
+
+            for key in self.product_group_keys.get(seed, []):
+                for other in self.groups.get(key, ()):
+                    if other in seeds:
+                        continue
+                    scores[other] = scores.get(other, 0.0) + BUNDLE_GROUP_WEIGHT
+                    reason = f"same {key[0].replace('_', ' ')}: {key[1]}"
+                    if reason not in reasons.setdefault(other, []):
+                        reasons[other].append(reason)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [{
+            "product_id": pid,
+            "score": round(score, 3),
+            "reasons": reasons[pid]
+        } for pid, score in ranked]
+
+    def bundle_types(self, product_ids: Iterable[int]) -> Counter:
+        return Counter(value for pid in product_ids
+                       for key, value in self.product_group_keys.get(
+                           int(pid), []) if key == "bundle_type")
+
+
+class BundleIndexStore:
+    """Holds the current BundleIndex and rebuilds it periodically.
+
+    Until the first full build finishes (it needs the order history), a
+    catalog-groups-only index is served so lookups never block on it.
+    """
+
+    def __init__(self,
+                 basket_loader: Callable[[], List[List[int]]],
+                 catalog_source: Callable[[], Optional[object]],
+                 refresh_interval: float = BUNDLE_INDEX_REFRESH_SECONDS):
+        self._basket_loader = basket_loader
+        self._catalog_source = catalog_source
+        self.refresh_interval = refresh_interval
+        self._index: Optional[BundleIndex] = None
+        self._builder: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> BundleIndex:
+        index = self._index
+        if index is None:
+            catalog = self._catalog_source()
+            index = BundleIndex(products=catalog.products if catalog else ())
+            with self._lock:
+                if self._index is None:
+                    self._index = index
+                index = self._index
+        self._start_builder()
+        return index
+
+    def rebuild(self) -> BundleIndex:
+        started = time.perf_counter()
+        catalog = self._catalog_source()
+        baskets = self._basket_loader()
+        index = BundleIndex(baskets, catalog.products if catalog else ())
+        self._index = index
+        print(f"🧺 Bundle index built from {index.order_count} orders and "
+              f"{len(index.groups)} catalog groups "
+              f"({time.perf_counter() - started:.2f}s).")
+        return index
+
+    def _start_builder(self):
+        with self._lock:
+            if self._builder is not None and self._builder.is_alive():
+                return
+            self._builder = threading.Thread(target=self._build_loop,
+                                             name="bundle-index",
+                                             daemon=True)
+            self._builder.start()
+
+    def _build_loop(self):
+        while True:
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"⚠️ Bundle index build failed: {e}")
+            time.sleep(self.refresh_interval)
+
+
+__all__ = ["BundleIndex", "BundleIndexStore", "field_key", "product_groups"]
@@ -0,0 +1,362 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from quote_agent.http_client import request
+
+CATALOG_FETCH_CONCURRENCY = int(
+    os.environ.get("CATALOG_FETCH_CONCURRENCY", "8"))
+CATALOG_FETCH_BATCH_SIZE = int(os.environ.get("CATALOG_FETCH_BATCH_SIZE",
+                                              "50"))
+CATALOG_FETCH_TIMEOUT = (5, 30)
+# Storefront GraphQL caps `first` on product connections at 50
+STOREFRONT_MAX_PAGE_SIZE = 50
+CATALOG_PAGE_RETRIES = 3
+# 429s on a single page or batch before the sync gives up
+CATALOG_PAGE_RATE_LIMIT_RETRIES = 10
+REST_PAGE_SIZE = 250
+
+PRODUCT_FIELDS_FRAGMENT = """
+fragment ProductFields on Product {
+  entityId
+  name
+  sku
+  description
+  path
+  defaultImage {
+    url640wide: url(width: 640)
+  }
+  prices {
+    price {
+      value
+      currencyCode
+    }
+  }
+  customFields {
+    edges {
+      node {
+        name
+        value
+      }
+    }
+  }
+}
+"""
+
+PRODUCTS_BY_ENTITY_IDS_QUERY = """
+query getProductsByEntityIds($entityIds: [Int!]!, $first: Int!) {
+  site {
+    products(entityIds: $entityIds, first: $first) {
+      edges {
+        node {
+          ...ProductFields
+        }
+      }
+    }
+  }
+}
+""" + PRODUCT_FIELDS_FRAGMENT
+
+PRODUCTS_PAGE_QUERY = """
+query getProductsPage($first: Int!, $after: String) {
+  site {
+    products(first: $first, after: $after) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      edges {
+        node {
+          ...ProductFields
+        }
+      }
+    }
+  }
+}
+""" + PRODUCT_FIELDS_FRAGMENT
+
+
+def normalize_product_node(node: dict) -> dict:
+    price = ((node.get("prices") or {}).get("price") or {}).get("value")
+    currency = ((node.get("prices") or {}).get("price")
+                or {}).get("currencyCode")
+
+    custom_fields = [
+        {
+            "name": cf["node"]["name"],
+            "value": cf["node"]["value"]
+        } for cf in (node.get("customFields") or {}).get("edges", [])
+        if cf.get("node", {}).get("name") and cf["node"].get("value")
+    ]
+
+    return {
+        "id": node.get("entityId"),
+        "name": node.get("name"),
+        "sku": node.get("sku"),
+        "path": node.get("path"),
+        "image": (node.get("defaultImage") or {}).get("url640wide"),
+        "price": price,
+        "currency": currency,
+        "description": (node.get("description") or "").strip(),
+        "custom_fields": custom_fields
+    }
+
+
+class RateLimited(Exception):
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def _retry_after(res: requests.Response) -> float:
+    for header in ("Retry-After", "X-Rate-Limit-Time-Reset-Ms"):
+        value = res.headers.get(header)
+        if value:
+            try:
+                seconds = float(value)
+            except ValueError:
+                continue
+            return seconds / 1000 if header.endswith("Ms") else seconds
+    return 1.0
+
+
+class CatalogFetcher:
+    """Concurrent Storefront GraphQL product fetcher.
+
+    Batches run on a bounded thread pool over the shared keep-alive session
+    and circuit breaker from `http_client`, with its retries disabled so
+    rate limits are handled adaptively here instead. A 429 halves the
+    concurrency and batch size and re-queues the batch; each clean run of
+    batches grows concurrency back towards the limit. Timings for every
+    batch of the last fetch are kept in `last_timings`.
+    """
+
+    def __init__(self,
+                 endpoint: str,
+                 max_concurrency: int = CATALOG_FETCH_CONCURRENCY,
+                 batch_size: int = CATALOG_FETCH_BATCH_SIZE,
+                 timeout=CATALOG_FETCH_TIMEOUT):
+        self.endpoint = endpoint
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_size = max(1, min(batch_size,
+                                         STOREFRONT_MAX_PAGE_SIZE))
+        self.timeout = timeout
+        self.last_timings: List[Dict] = []
+
+    def _fetch_batch(self, batch: List[int], headers: dict) -> List[dict]:
+        res = request("POST",
+                      self.endpoint,
+                      headers=headers,
+                      json={
+                          "query": PRODUCTS_BY_ENTITY_IDS_QUERY,
+                          "variables": {
+                              "entityIds": batch,
+                              "first": len(batch)
+                          }
+                      },
+                      timeout=self.timeout,
+                      max_retries=0)
+        if res.status_code == 429:
+            raise RateLimited(_retry_after(res))
+        res.raise_for_status()
+        data = res.json()
+        edges = data.get("data", {}).get("site", {}).get("products",
+                                                         {}).get("edges", [])
+        return [normalize_product_node(edge.get("node", {})) for edge in edges]
+
+    def fetch_by_entity_ids(self,
+                            entity_ids: List[int],
+                            headers: dict,
+                            raise_errors: bool = False) -> List[dict]:
+        """Fetches products by id; ids the Storefront doesn't return (deleted
+        or invisible) are simply absent. With `raise_errors`, a failed batch
+        raises instead of being skipped, so absence can be trusted."""
+        pending = [
+            list(entity_ids[i:i + self.max_batch_size])
+            for i in range(0, len(entity_ids), self.max_batch_size)
+        ]
+        concurrency = self.max_concurrency
+        batch_size = self.max_batch_size
+        products: List[dict] = []
+        timings: List[Dict] = []
+        pause_until: Optional[float] = None
+        rate_limited: Dict[int, int] = {}
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix="catalog-fetch") as pool:
+            in_flight = {}
+            while pending or in_flight:
+                if pause_until and not in_flight:
+                    time.sleep(max(0.0, pause_until - time.monotonic()))
+                    pause_until = None
+                while pending and len(in_flight) < concurrency and (
+                        pause_until is None):
+                    batch = pending.pop(0)
+                    if len(batch) > batch_size:
+                        pending.insert(0, batch[batch_size:])
+                        batch = batch[:batch_size]
+                    future = pool.submit(self._fetch_batch, batch, headers)
+                    in_flight[future] = (batch, time.perf_counter())
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, batch_started = in_flight.pop(future)
+                    timing = {
+                        "ids": f"{batch[0]}-{batch[-1]}",
+                        "size": len(batch),
+                        "concurrency": concurrency,
+                        "seconds": round(time.perf_counter() - batch_started,
+                                         3)
+                    }
+                    try:
+                        batch_products = future.result()
+                    except RateLimited as e:
+                        timing["status"] = "rate_limited"
+                        # Batches get split on re-queue, so count per id
+                        retries = 1 + max(
+                            rate_limited.get(pid, 0) for pid in batch)
+                        if retries > CATALOG_PAGE_RATE_LIMIT_RETRIES:
+                            self.last_timings = timings + [timing]
+                            raise
+                        rate_limited.update(dict.fromkeys(batch, retries))
+                        pending.insert(0, batch)
+                        concurrency = max(1, concurrency // 2)
+                        batch_size = max(1, batch_size // 2)
+                        pause_until = time.monotonic() + e.retry_after
+                    except Exception as e:
+                        timing["status"] = "error"
+                        print(f"❌ Error fetching batch {batch}: {e}")
+                        if raise_errors:
+                            self.last_timings = timings + [timing]
+                            raise
+                    else:
+                        timing["status"] = "ok"
+                        products.extend(batch_products)
+                        if concurrency < self.max_concurrency:
+                            concurrency += 1
+                        elif batch_size < self.max_batch_size:
+                            batch_size = min(self.max_batch_size,
+                                             batch_size * 2)
+                    timings.append(timing)
+
+        self.last_timings = timings
+        ok = [t["seconds"] for t in timings if t["status"] == "ok"]
+        print(f"📊 Fetched {len(products)} products in {len(timings)} "
+              f"batches ({time.perf_counter() - started:.2f}s total, "
+              f"slowest batch {max(ok, default=0):.2f}s).")
+        return products
+
+    def iter_product_pages(self, headers: dict) -> Iterator[List[dict]]:
+        """Walks the `products` connection by cursor, yielding each page.
+
+        Pages are fetched lazily, so callers can start serving the first
+        products while the rest of the catalog is still being synced. Raises
+        once a page keeps failing, so a cut-short sync is never mistaken for
+        a finished one.
+        """
+        cursor = None
+        pages = 0
+        count = 0
+        attempts = 0
+        rate_limited = 0
+        timings: List[Dict] = []
+        started = time.perf_counter()
+        self.last_timings = timings
+
+        while True:
+            page_started = time.perf_counter()
+            try:
+                res = request("POST",
+                              self.endpoint,
+                              headers=headers,
+                              json={
+                                  "query": PRODUCTS_PAGE_QUERY,
+                                  "variables": {
+                                      "first": STOREFRONT_MAX_PAGE_SIZE,
+                                      "after": cursor
+                                  }
+                              },
+                              timeout=self.timeout,
+                              max_retries=0)
+                if res.status_code == 429:
+                    raise RateLimited(_retry_after(res))
+                res.raise_for_status()
+                connection = res.json().get("data", {}).get("site", {}).get(
+                    "products", {})
+            except RateLimited as e:
+                rate_limited += 1
+                timings.append({"page": pages + 1, "status": "rate_limited"})
+                if rate_limited > CATALOG_PAGE_RATE_LIMIT_RETRIES:
+                    raise
+                time.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                attempts += 1
+                timings.append({"page": pages + 1, "status": "error"})
+                print(f"❌ Error fetching catalog page {pages + 1}: {e}")
+                if attempts >= CATALOG_PAGE_RETRIES:
+                    raise
+                time.sleep(attempts)
+                continue
+
+            attempts = 0
+            rate_limited = 0
+            pages += 1
+            products = [
+                normalize_product_node(edge.get("node", {}))
+                for edge in connection.get("edges", [])
+            ]
+            count += len(products)
+            timings.append({
+                "page": pages,
+                "size": len(products),
+                "status": "ok",
+                "seconds": round(time.perf_counter() - page_started, 3)
+            })
+            if products:
+                yield products
+
+            page_info = connection.get("pageInfo") or {}
+            cursor = page_info.get("endCursor")
+            if not page_info.get("hasNextPage") or not cursor:
+                break
+
+        print(f"📊 Synced {count} products in {pages} pages "
+              f"({time.perf_counter() - started:.2f}s total).")
+
+    def fetch_rest_product_ids(self, products_url: str, headers: dict,
+                               params: dict) -> List[int]:
+        """Pages through the REST v3 catalog products endpoint for ids only.
+
+        Product data itself always comes from the Storefront query, so
+        prices and images keep the same basis as a full sync.
+        """
+        page = 1
+        product_ids: List[int] = []
+        while True:
+            res = request("GET",
+                          products_url,
+                          headers=headers,
+                          params={
+                              **params, "include_fields": "id",
+                              "limit": REST_PAGE_SIZE,
+                              "page": page
+                          },
+                          timeout=self.timeout)
+            res.raise_for_status()
+            body = res.json()
+            product_ids.extend(p["id"] for p in body.get("data", []))
+            pagination = body.get("meta", {}).get("pagination", {})
+            if page >= pagination.get("total_pages", 1):
+                return product_ids
+            page += 1
+
+
+__all__ = [
+    "CatalogFetcher", "normalize_product_node"
+]
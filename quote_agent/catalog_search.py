@@ -0,0 +1,285 @@
+import heapq
+import math
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Name and SKU matches count more than description/custom field matches
+FIELD_WEIGHTS = {"name": 2, "sku": 3}
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def product_search_text(product: dict) -> str:
+    """Flattens a product into the text used for memory and search."""
+    lines = [f"{product['name']}"]
+    if product.get("sku"):
+        lines.append(f"SKU: {product['sku']}")
+    if product.get("price"):
+        lines.append(f"Price: {product['currency']} {product['price']}")
+    if product.get("custom_fields"):
+        for cf in product["custom_fields"]:
+            lines.append(f"{cf['name']}: {cf['value']}")
+    if product.get("description"):
+        lines.append(product["description"])
+    return "\n".join(lines)
+
+
+def _product_terms(product: dict) -> Counter:
+    terms = Counter(tokenize(product_search_text(product)))
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(product.get(field) or ""):
+            terms[token] += weight - 1
+    sku = (product.get("sku") or "").lower()
+    if sku:
+        # Let exact SKU queries like "cp-15-3m" hit as a single term
+        terms[sku] += FIELD_WEIGHTS["sku"]
+    return terms
+
+
+class CatalogSearchIndex:
+    """Inverted index over catalog products ranked with Okapi BM25.
+
+    Queries only touch the posting lists of their own terms, so cost grows
+    with how common the query terms are rather than with catalog size.
+    """
+
+    def __init__(self, products: Iterable[dict] = (), k1: float = 1.2,
+                 b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # Only the term keys are kept per doc; they are all `remove` needs
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_len: Dict[int, int] = {}
+        self._total_len = 0
+        # Terms whose posting lists this copy owns; None means all of them
+        self._owned: Optional[Set[str]] = None
+        for product in products:
+            self.add(product)
+
+    def copy(self) -> "CatalogSearchIndex":
+        """Copy that shares posting lists until it modifies them."""
+        index = CatalogSearchIndex(k1=self.k1, b=self.b)
+        index._postings = dict(self._postings)
+        index._doc_terms = dict(self._doc_terms)
+        index._doc_len = dict(self._doc_len)
+        index._total_len = self._total_len
+        index._owned = set()
+        return index
+
+    def _writable(self, term: str) -> Dict[int, int]:
+        postings = self._postings.get(term)
+        if postings is None:
+            postings = self._postings[term] = {}
+        elif self._owned is not None and term not in self._owned:
+            postings = self._postings[term] = dict(postings)
+        if self._owned is not None:
+            self._owned.add(term)
+        return postings
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, product: dict):
+        doc_id = product["id"]
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+        terms = _product_terms(product)
+        for term, tf in terms.items():
+            self._writable(term)[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(terms)
+        length = sum(terms.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: int):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            if term in self._postings:
+                postings = self._writable(term)
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def _idf(self, term: str) -> float:
+        n = len(self._doc_len)
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        if not self._doc_len:
+            return []
+        avgdl = self._total_len / len(self._doc_len)
+        query_terms = set(tokenize(query))
+        query_lower = (query or "").strip().lower()
+        if query_lower in self._postings:
+            query_terms.add(query_lower)
+
+        scores: Dict[int, float] = {}
+        for term in query_terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b +
+                                  self.b * self._doc_len[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                    tf * (self.k1 + 1)) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(tokenize(name))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyNameIndex:
+    """Trigram index for approximate product-name lookups.
+
+    Candidates are retrieved through trigram posting lists, rarest grams
+    first and within a fixed posting budget, and only the best
+    `candidate_pool` are rescored with SequenceMatcher. Per-name trigram
+    sets are derived on demand rather than stored alongside the postings.
+    """
+
+    def __init__(self,
+                 products: Iterable[dict] = (),
+                 candidate_pool: int = 50,
+                 posting_budget: int = 5000,
+                 min_grams: int = 3):
+        self.candidate_pool = candidate_pool
+        self.posting_budget = posting_budget
+        self.min_grams = min_grams
+        self._postings: Dict[str, Set[int]] = {}
+        self._names: Dict[int, str] = {}
+        self._grams: Dict[int, Set[str]] = {}
+        # Grams whose posting sets this copy owns; None means all of them
+        self._owned: Optional[Set[str]] = None
+        for product in products:
+            self.add(product)
+
+    def copy(self) -> "FuzzyNameIndex":
+        """Copy that shares posting sets until it modifies them."""
+        index = FuzzyNameIndex(candidate_pool=self.candidate_pool,
+                               posting_budget=self.posting_budget,
+                               min_grams=self.min_grams)
+        index._postings = dict(self._postings)
+        index._names = dict(self._names)
+        index._grams = dict(self._grams)
+        index._owned = set()
+        return index
+
+    def _writable(self, gram: str) -> Set[int]:
+        postings = self._postings.get(gram)
+        if postings is None:
+            postings = self._postings[gram] = set()
+        elif self._owned is not None and gram not in self._owned:
+            postings = self._postings[gram] = set(postings)
+        if self._owned is not None:
+            self._owned.add(gram)
+        return postings
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, product: dict):
+        doc_id = product["id"]
+        if doc_id in self._names:
+            self.remove(doc_id)
+        name = _normalize_name(product.get("name") or "")
+        if not name:
+            return
+        grams = _trigrams(name)
+        for gram in grams:
+            self._writable(gram).add(doc_id)
+        self._names[doc_id] = name
+        self._grams[doc_id] = grams
+
+    def _doc_grams(self, doc_id: int) -> Set[str]:
+        grams = self._grams.get(doc_id)
+        if grams is None:
+            grams = self._grams[doc_id] = _trigrams(self._names[doc_id])
+        return grams
+
+    def remove(self, doc_id: int):
+        if doc_id not in self._names:
+            return
+        grams = self._doc_grams(doc_id)
+        del self._grams[doc_id]
+        for gram in grams:
+            if gram in self._postings:
+                postings = self._writable(gram)
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[gram]
+        del self._names[doc_id]
+
+    def search(self,
+               query: str,
+               k: int = 5,
+               cutoff: float = 0.6) -> List[Tuple[int, float]]:
+        name = _normalize_name(query)
+        if not name or not self._names:
+            return []
+        query_grams = _trigrams(name)
+        # Count overlaps on the rarest grams first and stop once the posting
+        # budget is spent; a real match shares most grams, so it still ranks
+        grams = sorted((g for g in query_grams if g in self._postings),
+                       key=lambda g: len(self._postings[g]))
+        overlap: Counter = Counter()
+        visited = 0
+        for i, gram in enumerate(grams):
+            postings = self._postings[gram]
+            if i >= self.min_grams and visited + len(
+                    postings) > self.posting_budget:
+                break
+            overlap.update(postings)
+            visited += len(postings)
+        if not overlap:
+            return []
+
+        candidates = heapq.nlargest(self.candidate_pool,
+                                    overlap.items(),
+                                    key=itemgetter(1))
+        coarse = []
+        for doc_id, _ in candidates:
+            doc_grams = self._doc_grams(doc_id)
+            shared = len(query_grams & doc_grams)
+            containment = shared / len(query_grams)
+            dice = 2 * shared / (len(query_grams) + len(doc_grams))
+            coarse.append((doc_id, 0.75 * containment + 0.25 * dice))
+
+        # Rescore the best gram matches on character sequence similarity
+        matcher = SequenceMatcher(None, b=name)
+        scored = []
+        for doc_id, gram_score in heapq.nlargest(k + 3, coarse,
+                                                 key=itemgetter(1)):
+            doc_name = self._names[doc_id]
+            matcher.set_seq1(doc_name)
+            score = 0.8 * gram_score + 0.2 * matcher.ratio()
+            if doc_name == name:
+                score = 1.0
+            elif name in doc_name:
+                score = max(score, 0.95)
+            if score >= cutoff:
+                scored.append((doc_id, round(score, 3)))
+        return heapq.nlargest(k, scored, key=itemgetter(1))
+
+__all__ = [
+    "CatalogSearchIndex", "FuzzyNameIndex", "product_search_text", "tokenize"
+]
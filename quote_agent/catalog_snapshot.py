@@ -0,0 +1,79 @@
+import json
+import os
+import stat
+import tempfile
+import time
+from typing import Optional
+
+# Bump whenever the snapshot changes shape; older files are ignored
+SNAPSHOT_FORMAT = 3
+CATALOG_SNAPSHOT_PATH = os.environ.get(
+    "CATALOG_SNAPSHOT_PATH",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME",
+                       os.path.join(os.path.expanduser("~"), ".cache")),
+        "quote_agent", "catalog_snapshot.json"))
+
+
+def save_snapshot(catalog, path: str = CATALOG_SNAPSHOT_PATH) -> bool:
+    """Writes the catalog's products to `path` atomically.
+
+    Indexes are left out: they are rebuilt lazily on first use, which is
+    cheaper than serializing them. The file is plain JSON, readable and
+    writable by the owner only.
+    """
+    if not path or not catalog.complete:
+        return False
+    started = time.perf_counter()
+    try:
+        state = {"format": SNAPSHOT_FORMAT, "catalog": catalog.to_dict()}
+        payload = json.dumps(state, separators=(",", ":")).encode("utf-8")
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ Failed to write catalog snapshot: {e}")
+        return False
+    print(f"💾 Catalog snapshot written (version={catalog.version}, "
+          f"{len(payload) / 1e6:.1f} MB, "
+          f"{time.perf_counter() - started:.2f}s).")
+    return True
+
+
+def _trusted(path: str) -> bool:
+    """Only files we own and nobody else can write are loaded."""
+    info = os.stat(path)
+    if info.st_uid != os.getuid():
+        print(f"⚠️ Ignoring catalog snapshot not owned by us: {path}")
+        return False
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        print(f"⚠️ Ignoring group/world-writable catalog snapshot: {path}")
+        return False
+    return True
+
+
+def load_snapshot(path: str = CATALOG_SNAPSHOT_PATH) -> Optional[dict]:
+    if not path or not os.path.exists(path):
+        return None
+    started = time.perf_counter()
+    try:
+        if not _trusted(path):
+            return None
+        with open(path, "rb") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Failed to read catalog snapshot: {e}")
+        return None
+    if not isinstance(data, dict) or data.get("format") != SNAPSHOT_FORMAT:
+        print("⚠️ Ignoring catalog snapshot with an old format.")
+        return None
+    print(f"📂 Catalog snapshot read "
+          f"({time.perf_counter() - started:.3f}s).")
+    return data["catalog"]
+
+
+__all__ = ["CATALOG_SNAPSHOT_PATH", "load_snapshot", "save_snapshot"]
@@ -0,0 +1,505 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from quote_agent.catalog_search import CatalogSearchIndex, FuzzyNameIndex
+from quote_agent.catalog_snapshot import (
+    CATALOG_SNAPSHOT_PATH,
+    load_snapshot,
+    save_snapshot,
+)
+
+CATALOG_TTL_SECONDS = float(os.environ.get("CATALOG_TTL_SECONDS", "900"))
+# Fraction of the TTL after which the background refresher reloads the catalog
+CATALOG_REFRESH_AHEAD = float(os.environ.get("CATALOG_REFRESH_AHEAD", "0.8"))
+CATALOG_DELTA_INTERVAL_SECONDS = float(
+    os.environ.get("CATALOG_DELTA_INTERVAL_SECONDS", "30"))
+# Products modified this long before the watermark are fetched again, to
+# cover clock skew between us and the catalog API
+CATALOG_DELTA_OVERLAP_SECONDS = 5.0
+# Recent complete versions kept so sessions pinned to one can finish a turn
+CATALOG_RETAINED_VERSIONS = int(
+    os.environ.get("CATALOG_RETAINED_VERSIONS", "3"))
+# Minimum gap between snapshot writes; deltas in between are coalesced
+CATALOG_SNAPSHOT_INTERVAL_SECONDS = float(
+    os.environ.get("CATALOG_SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+# (since_epoch_seconds, dirty_ids) -> (changed_products, removed_ids)
+DeltaLoader = Callable[[float, Set[int]], Tuple[List[dict], List[int]]]
+
+
+def catalog_version(products: List[dict]) -> str:
+    payload = json.dumps(products, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Catalog:
+    """A loaded product list shared by every session in the process.
+
+    Lookup indexes by id, SKU and lower-cased name are built once per
+    catalog version so per-line lookups in the tools are constant time.
+    A published catalog is never modified; `with_delta` returns a patched
+    copy instead.
+    """
+
+    def __init__(self,
+                 products: List[dict],
+                 loaded_at: Optional[float] = None,
+                 complete: bool = True,
+                 synced_at: Optional[float] = None):
+        self.products = products
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        # Watermark for delta refreshes: when the data was last read upstream
+        self.synced_at = synced_at if synced_at is not None else self.loaded_at
+        # False while a paginated sync is still streaming pages in
+        self.complete = complete
+        self.version = catalog_version(products)
+        self._build_lookups()
+
+    def _build_lookups(self):
+        self.by_id: Dict[int, dict] = {}
+        self.by_sku: Dict[str, dict] = {}
+        self.by_name: Dict[str, dict] = {}
+        self._positions: Dict[int, int] = {}
+        for position, product in enumerate(self.products):
+            self._positions[product["id"]] = position
+            self._index(product)
+
+    def _index(self, product: dict):
+        self.by_id[product["id"]] = product
+        if product.get("sku"):
+            self.by_sku.setdefault(product["sku"], product)
+        if product.get("name"):
+            self.by_name.setdefault(product["name"].lower(), product)
+
+    def _unindex(self, product: dict):
+        self.by_id.pop(product["id"], None)
+        if self.by_sku.get(product.get("sku")) is product:
+            del self.by_sku[product["sku"]]
+        name = (product.get("name") or "").lower()
+        if self.by_name.get(name) is product:
+            del self.by_name[name]
+
+    def _copy(self) -> "Catalog":
+        """Shallow copy sharing product dicts and untouched posting lists."""
+        catalog = Catalog.__new__(Catalog)
+        catalog.products = list(self.products)
+        catalog.loaded_at = self.loaded_at
+        catalog.synced_at = self.synced_at
+        catalog.complete = self.complete
+        catalog.version = self.version
+        catalog.by_id = dict(self.by_id)
+        catalog.by_sku = dict(self.by_sku)
+        catalog.by_name = dict(self.by_name)
+        catalog._positions = dict(self._positions)
+        # Indexes that have not been built yet will see the new products
+        for name in ("search_index", "name_index"):
+            index = self.__dict__.get(name)
+            if index is not None:
+                catalog.__dict__[name] = index.copy()
+        return catalog
+
+    def with_delta(self,
+                   changed: List[dict],
+                   removed: Iterable[int] = (),
+                   synced_at: Optional[float] = None
+                   ) -> Tuple["Catalog", int]:
+        """Returns a new catalog with `changed` upserted and `removed` ids
+        dropped, plus the number of products patched.
+
+        The catalog itself is never modified, so callers holding it keep a
+        consistent view. With nothing to patch it is returned as is.
+        """
+        removed_ids = {
+            product_id
+            for product_id in removed if product_id in self.by_id
+        }
+        changed = [
+            product for product in changed
+            if self.by_id.get(product["id"]) != product
+        ]
+        applied = len(changed) + len(removed_ids)
+        if not applied:
+            if synced_at is not None:
+                self.synced_at = synced_at
+            return self, 0
+
+        catalog = self._copy()
+        search_index = catalog.__dict__.get("search_index")
+        name_index = catalog.__dict__.get("name_index")
+        if removed_ids:
+            for product_id in removed_ids:
+                catalog._unindex(catalog.by_id[product_id])
+                for index in (search_index, name_index):
+                    if index is not None:
+                        index.remove(product_id)
+            catalog.products = [
+                p for p in catalog.products if p["id"] not in removed_ids
+            ]
+            catalog._positions = {
+                p["id"]: i
+                for i, p in enumerate(catalog.products)
+            }
+
+        for product in changed:
+            old = catalog.by_id.get(product["id"])
+            if old is not None:
+                catalog._unindex(old)
+                catalog.products[catalog._positions[product["id"]]] = product
+            else:
+                catalog._positions[product["id"]] = len(catalog.products)
+                catalog.products.append(product)
+            catalog._index(product)
+            for index in (search_index, name_index):
+                if index is not None:
+                    index.add(product)
+
+        catalog.version = catalog_version([self.version] + changed +
+                                          sorted(removed_ids))
+        if synced_at is not None:
+            catalog.synced_at = synced_at
+        return catalog, applied
+
+    def to_dict(self) -> dict:
+        """JSON-safe copy of products and metadata; indexes are rebuilt."""
+        return {
+            "products": self.products,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "synced_at": self.synced_at,
+            "complete": self.complete,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "Catalog":
+        catalog = cls.__new__(cls)
+        catalog.products = state["products"]
+        catalog.version = state["version"]
+        catalog.loaded_at = state["loaded_at"]
+        catalog.synced_at = state["synced_at"]
+        catalog.complete = state["complete"]
+        catalog._build_lookups()
+        return catalog
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id) -> Optional[dict]:
+        try:
+            return self.by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_sku(self, sku: str) -> Optional[dict]:
+        return self.by_sku.get(sku)
+
+    def get_by_name(self, name: str) -> Optional[dict]:
+        return self.by_name.get((name or "").lower())
+
+    def age(self) -> float:
+        return time.time() - self.loaded_at
+
+    @cached_property
+    def search_index(self) -> CatalogSearchIndex:
+        return CatalogSearchIndex(self.products)
+
+    @cached_property
+    def name_index(self) -> FuzzyNameIndex:
+        return FuzzyNameIndex(self.products)
+
+
+class CatalogStore:
+    """Process-wide catalog cache with a TTL and background refresh.
+
+    The first `get()` loads the catalog synchronously; after that a daemon
+    thread reloads it once it reaches `refresh_ahead * ttl`, so callers are
+    served from memory and never wait on the Storefront API.
+
+    With a `page_loader`, a cold load only blocks until the first page
+    arrives. The remaining pages stream in on a background thread, and a
+    growing partial catalog is published each time it doubles in size.
+
+    With a `delta_loader`, the refresher also fetches products modified
+    since the last sync (plus any ids passed to `mark_dirty`) every
+    `delta_interval` seconds and publishes a patched copy of the catalog.
+    The last `retained_versions` complete catalogs stay reachable through
+    `get_version` for sessions pinned to them.
+
+    Complete catalogs are written to `snapshot_path` after a load or
+    applied delta, at most once per `snapshot_interval`; only the newest
+    catalog waiting in that window is written. A cold worker serves the snapshot immediately and
+    revalidates it in the background, with a delta if it is fresh enough
+    or a full reload otherwise.
+    """
+
+    def __init__(self,
+                 loader: Callable[[], List[dict]],
+                 ttl: float = CATALOG_TTL_SECONDS,
+                 refresh_ahead: float = CATALOG_REFRESH_AHEAD,
+                 page_loader: Optional[Callable[[],
+                                                Iterable[List[dict]]]] = None,
+                 delta_loader: Optional[DeltaLoader] = None,
+                 delta_interval: float = CATALOG_DELTA_INTERVAL_SECONDS,
+                 snapshot_path: Optional[str] = CATALOG_SNAPSHOT_PATH,
+                 snapshot_interval: float = CATALOG_SNAPSHOT_INTERVAL_SECONDS,
+                 retained_versions: int = CATALOG_RETAINED_VERSIONS):
+        self._loader = loader
+        self.retained_versions = max(1, retained_versions)
+        self._retained: "OrderedDict[str, Catalog]" = OrderedDict()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_pending: Optional[Catalog] = None
+        self._snapshot_writer: Optional[threading.Thread] = None
+        self._snapshot_written_at = float("-inf")
+        self._page_loader = page_loader
+        self._delta_loader = delta_loader
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.delta_interval = delta_interval
+        self._catalog: Optional[Catalog] = None
+        self._load_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._streamer: Optional[threading.Thread] = None
+        self._dirty: Set[int] = set()
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def get(self) -> Catalog:
+        catalog = self._catalog
+        if catalog is None or catalog.age() >= self.ttl:
+            catalog = self._reload(stale=catalog)
+        return catalog
+
+    def peek(self) -> Optional[Catalog]:
+        return self._catalog
+
+    def get_version(self, version: str) -> Optional[Catalog]:
+        """Returns the catalog for `version` if it is still retained."""
+        return self._retained.get(version)
+
+    def _publish(self, catalog: Catalog):
+        self._catalog = catalog
+        if catalog.complete:
+            self._retained[catalog.version] = catalog
+            self._retained.move_to_end(catalog.version)
+            while len(self._retained) > self.retained_versions:
+                self._retained.popitem(last=False)
+
+    def refresh(self) -> Catalog:
+        return self._reload(stale=self._catalog, force=True)
+
+    def mark_dirty(self, product_ids: Iterable[int]):
+        """Queues products (e.g. from a webhook) for the next delta refresh."""
+        with self._dirty_lock:
+            self._dirty.update(int(pid) for pid in product_ids)
+        self._wakeup.set()
+
+    def refresh_delta(self) -> int:
+        catalog = self._catalog
+        if self._delta_loader is None or catalog is None or not catalog.complete:
+            return 0
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+
+        started = time.time()
+        since = catalog.synced_at - CATALOG_DELTA_OVERLAP_SECONDS
+        try:
+            changed, removed = self._delta_loader(since, dirty)
+        except Exception as e:
+            print(f"❌ Catalog delta refresh failed: {e}")
+            with self._dirty_lock:
+                self._dirty.update(dirty)
+            return 0
+
+        with self._load_lock:
+            if self._catalog is not catalog:
+                # A full reload replaced the catalog while we were fetching
+                return 0
+            updated, applied = catalog.with_delta(changed,
+                                                  removed,
+                                                  synced_at=started)
+            if applied:
+                self._publish(updated)
+        if applied:
+            print(f"🔁 Catalog delta applied ({applied} products patched, "
+                  f"version={updated.version}).")
+            self._save_snapshot(updated)
+        return applied
+
+    def _reload(self,
+                stale: Optional[Catalog],
+                force: bool = False) -> Catalog:
+        with self._load_lock:
+            current = self._catalog
+            # Another caller finished a load while we waited for the lock
+            if current is not None and current is not stale and not force:
+                return current
+            if self._streamer is not None and self._streamer.is_alive():
+                return current if current is not None else Catalog([])
+            if current is None and self._restore_snapshot():
+                return self._catalog
+            if current is None and self._page_loader is not None:
+                return self._start_stream()
+
+            started = time.perf_counter()
+            synced_at = time.time()
+            try:
+                products = self._loader()
+            except Exception as e:
+                print(f"❌ Catalog load failed: {e}")
+                products = []
+
+            if not products:
+                if current is None:
+                    # Don't cache a failed cold load; the next caller retries
+                    return Catalog([])
+                print("⚠️ Catalog load returned nothing; keeping cached copy.")
+                current.loaded_at = time.time()
+                return current
+
+            self._publish(Catalog(products, synced_at=synced_at))
+            print(f"✅ Catalog cached (version={self._catalog.version}, "
+                  f"{len(products)} products, "
+                  f"{time.perf_counter() - started:.2f}s).")
+            self._ensure_refresher()
+            self._save_snapshot(self._catalog)
+            return self._catalog
+
+    def _restore_snapshot(self) -> bool:
+        data = load_snapshot(self.snapshot_path) if self.snapshot_path else None
+        if data is None:
+            return False
+        try:
+            catalog = Catalog.from_dict(data)
+        except Exception as e:
+            print(f"⚠️ Failed to restore catalog snapshot: {e}")
+            return False
+        if not len(catalog):
+            return False
+
+        if catalog.age() >= self.ttl * self.refresh_ahead:
+            # Serve it now, but let the refresher reload it straight away
+            # instead of blocking callers on a TTL miss
+            catalog.loaded_at = time.time() - self.ttl * self.refresh_ahead
+        self._publish(catalog)
+        print(f"✅ Catalog restored from snapshot (version={catalog.version}, "
+              f"{len(catalog)} products).")
+        self._ensure_refresher()
+        # Revalidate with a delta right away
+        self._wakeup.set()
+        return True
+
+    def _save_snapshot(self, catalog: Catalog):
+        if not self.snapshot_path or not catalog.complete:
+            return
+        with self._snapshot_lock:
+            self._snapshot_pending = catalog
+            if self._snapshot_writer is not None:
+                return
+            self._snapshot_writer = threading.Thread(
+                target=self._write_snapshots,
+                name="catalog-snapshot",
+                daemon=True)
+            self._snapshot_writer.start()
+
+    def _write_snapshots(self):
+        while True:
+            time.sleep(
+                max(0.0, self._snapshot_written_at + self.snapshot_interval -
+                    time.monotonic()))
+            with self._snapshot_lock:
+                catalog = self._snapshot_pending
+                self._snapshot_pending = None
+                if catalog is None:
+                    self._snapshot_writer = None
+                    return
+            save_snapshot(catalog, self.snapshot_path)
+            self._snapshot_written_at = time.monotonic()
+
+    def _start_stream(self) -> Catalog:
+        first_page = threading.Event()
+        self._streamer = threading.Thread(target=self._stream_pages,
+                                          args=(first_page, ),
+                                          name="catalog-sync",
+                                          daemon=True)
+        self._streamer.start()
+        first_page.wait()
+        return self._catalog if self._catalog is not None else Catalog([])
+
+    def _stream_pages(self, first_page: threading.Event):
+        started = time.perf_counter()
+        synced_at = time.time()
+        previous = self._catalog
+        products: List[dict] = []
+        published = 0
+        try:
+            for page in self._page_loader():
+                products.extend(page)
+                if len(products) >= 2 * published:
+                    self._publish(Catalog(list(products), complete=False))
+                    published = len(products)
+                    first_page.set()
+        except Exception as e:
+            print(f"❌ Catalog sync failed after {len(products)} products: "
+                  f"{e}")
+            self._sync_failed(previous)
+        else:
+            if products:
+                self._publish(Catalog(products, synced_at=synced_at))
+                print(f"✅ Catalog synced (version={self._catalog.version}, "
+                      f"{len(products)} products, "
+                      f"{time.perf_counter() - started:.2f}s).")
+                self._ensure_refresher()
+                self._save_snapshot(self._catalog)
+        finally:
+            first_page.set()
+
+    def _sync_failed(self, previous: Optional[Catalog]):
+        """Keeps the last complete catalog, or the partial one, after a
+        failed sync; neither is snapshotted. A full reload is retried after
+        `delta_interval`."""
+        if previous is not None and previous.complete:
+            self._publish(previous)
+        catalog = self._catalog
+        if catalog is None:
+            return
+        catalog.loaded_at = (time.time() - self.ttl * self.refresh_ahead +
+                             self.delta_interval)
+        self._ensure_refresher()
+
+    def _ensure_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop,
+                                           name="catalog-refresher",
+                                           daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        next_delta = time.monotonic() + self.delta_interval
+        while True:
+            catalog = self._catalog
+            if catalog is None:
+                return
+            wait = self.ttl * self.refresh_ahead - catalog.age()
+            if wait <= 0:
+                print("🔄 Refreshing catalog in background...")
+                self.refresh()
+                next_delta = time.monotonic() + self.delta_interval
+                continue
+            if self._delta_loader is not None:
+                if self._wakeup.is_set() or time.monotonic() >= next_delta:
+                    self._wakeup.clear()
+                    self.refresh_delta()
+                    next_delta = time.monotonic() + self.delta_interval
+                wait = min(wait, max(0.0, next_delta - time.monotonic()))
+            self._wakeup.wait(wait)
+
+
+__all__ = ["Catalog", "CatalogStore", "catalog_version"]
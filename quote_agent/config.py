@@ -1,8 +1,10 @@
 import os
 
+from quote_agent.pricing import DISCOUNT_THRESHOLD
+
 
 class Config:
-    DISCOUNT_THRESHOLD = 0.05
+    DISCOUNT_THRESHOLD = DISCOUNT_THRESHOLD
     DEFAULT_CURRENCY = "GBP"
     store_hash = os.environ["BIGCOMMERCE_STORE_HASH"]
     api_token = os.environ["BIGCOMMERCE_API_TOKEN"]
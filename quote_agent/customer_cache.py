@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+CUSTOMER_ADDRESS_TTL_SECONDS = float(
+    os.environ.get("CUSTOMER_ADDRESS_TTL_SECONDS", "3600"))
+CUSTOMER_ADDRESS_CACHE_SIZE = int(
+    os.environ.get("CUSTOMER_ADDRESS_CACHE_SIZE", "1024"))
+
+BillingAddressLoader = Callable[[int], Optional[dict]]
+
+
+class CustomerAddressCache:
+    """TTL cache of customer billing addresses.
+
+    Addresses rarely change between orders, so they are served from memory
+    until they expire or an address webhook invalidates them. Concurrent
+    misses for the same customer share one request.
+    """
+
+    def __init__(self,
+                 loader: BillingAddressLoader,
+                 ttl: float = CUSTOMER_ADDRESS_TTL_SECONDS,
+                 maxsize: int = CUSTOMER_ADDRESS_CACHE_SIZE):
+        self._loader = loader
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._key_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, customer_id: int) -> Optional[dict]:
+        with self._lock:
+            return self._cache.get(customer_id)
+
+    def _key_lock(self, customer_id: int) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(customer_id, threading.Lock())
+
+    def get(self, customer_id: int) -> Optional[dict]:
+        customer_id = int(customer_id)
+        address = self._cached(customer_id)
+        if address is not None:
+            return address
+        with self._key_lock(customer_id):
+            address = self._cached(customer_id)
+            if address is not None:
+                return address
+            print(f"🏠 Fetching billing address for customer {customer_id}...")
+            address = self._loader(customer_id)
+            if address is not None:
+                with self._lock:
+                    self._cache[customer_id] = address
+            return address
+
+    async def get_async(self, customer_id: int) -> Optional[dict]:
+        address = self._cached(int(customer_id))
+        if address is not None:
+            return address
+        return await asyncio.to_thread(self.get, customer_id)
+
+    def invalidate(self, customer_id: int):
+        with self._lock:
+            self._cache.pop(int(customer_id), None)
+
+
+def webhook_customer_id(payload: dict) -> Optional[int]:
+    """Reads the customer id from a `store/customer/*` webhook payload."""
+    scope = payload.get("scope", "")
+    data = payload.get("data") or {}
+    if scope.startswith("store/customer/address/"):
+        customer_id = (data.get("address") or {}).get("customer_id")
+    elif scope.startswith("store/customer/"):
+        customer_id = data.get("id")
+    else:
+        return None
+    return int(customer_id) if customer_id is not None else None
+
+
+__all__ = ["CustomerAddressCache", "webhook_customer_id"]
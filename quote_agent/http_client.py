@@ -0,0 +1,319 @@
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "10"))
+CIRCUIT_FAILURE_THRESHOLD = int(
+    os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+# httpx only speaks HTTP/2 when the optional `h2` package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after consecutive failures.
+
+    While open, calls fail fast. After `reset_timeout` one trial call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Frees a half-open trial whose call ended without an outcome
+        (e.g. cancelled), so the next caller can make the trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or (self.failures
+                                              >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_sessions: Dict[str, requests.Session] = {}
+_registry_lock = threading.Lock()
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary())
+
+
+def _endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    key = _endpoint(url)
+    with _registry_lock:
+        return _breakers.setdefault(key, CircuitBreaker())
+
+
+def breaker_states() -> Dict[str, str]:
+    with _registry_lock:
+        return {key: breaker.state for key, breaker in _breakers.items()}
+
+
+def get_session(url: str) -> requests.Session:
+    """Returns the pooled keep-alive requests.Session for the URL's host."""
+    host = urlsplit(url).netloc
+    with _registry_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=HTTP_MAX_KEEPALIVE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled AsyncClient for the running event loop.
+
+    Connections are pooled per loop, since an AsyncClient can't be shared
+    across loops.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT,
+                                  connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+        _clients[loop] = client
+    return client
+
+
+def retry_delay(attempt: int, headers=None) -> float:
+    """Seconds to wait before retry `attempt` (1-based).
+
+    Honours Retry-After and BigCommerce's X-Rate-Limit-Time-Reset-Ms when
+    present, otherwise uses full-jitter exponential backoff.
+    """
+    headers = headers or {}
+    reset_ms = headers.get("X-Rate-Limit-Time-Reset-Ms")
+    retry_after = headers.get("Retry-After")
+    for value, scale in ((reset_ms, 1000), (retry_after, 1)):
+        if value:
+            try:
+                return min(HTTP_BACKOFF_MAX, float(value) / scale)
+            except ValueError:
+                pass
+    ceiling = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**(attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def _never_sent(e: requests.RequestException) -> bool:
+    """True when the request failed before reaching the server.
+
+    A connection dropped after the body was sent also surfaces as a
+    requests.ConnectionError, so only connect failures count.
+    """
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if not isinstance(e, requests.ConnectionError) or not e.args:
+        return False
+    # requests wraps urllib3's MaxRetryError, whose reason is the cause
+    reason = getattr(e.args[0], "reason", e.args[0])
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError,
+                               urllib3.exceptions.EmptyPoolError))
+
+
+def _should_retry(method: str, status: Optional[int], idempotent: bool,
+                  connect_error: bool) -> bool:
+    # A 429 or a failed connect means the request was never processed, so
+    # even non-idempotent calls (order/quote creation) are safe to resend
+    if status == 429 or connect_error:
+        return True
+    if method.upper() == "GET" or idempotent:
+        return status is None or status in RETRY_STATUSES
+    return False
+
+
+def request(method: str,
+            url: str,
+            *,
+            idempotent: bool = False,
+            max_retries: int = HTTP_MAX_RETRIES,
+            timeout=None,
+            **kwargs) -> requests.Response:
+    """Blocking request over the shared session with retries and breaker.
+
+    POSTs are only retried on 429 or failures to connect unless the caller
+    marks them `idempotent` (e.g. GraphQL queries).
+    """
+    breaker = get_breaker(url)
+    session = get_session(url)
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    attempt = 0
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {_endpoint(url)}")
+        try:
+            res = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            connect_error = _never_sent(e)
+            if attempt > max_retries or not _should_retry(
+                    method, None, idempotent, connect_error):
+                raise
+            time.sleep(retry_delay(attempt))
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+
+        if res.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if res.status_code in RETRY_STATUSES and attempt <= max_retries and (
+                _should_retry(method, res.status_code, idempotent, False)):
+            time.sleep(retry_delay(attempt, res.headers))
+            continue
+        return res
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+async def request_async(method: str,
+                        url: str,
+                        *,
+                        idempotent: bool = False,
+                        max_retries: int = HTTP_MAX_RETRIES,
+                        headers: Optional[dict] = None,
+                        json=None,
+                        params: Optional[dict] = None) -> httpx.Response:
+    """Async counterpart of `request`, sharing its retry and breaker rules."""
+    breaker = get_breaker(url)
+    client = get_async_client()
+    attempt = 0
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {_endpoint(url)}")
+        try:
+            res = await client.request(method,
+                                       url,
+                                       headers=headers,
+                                       json=json,
+                                       params=params)
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            # Read/write errors may follow a delivered request; connect and
+            # pool failures never left the client
+            connect_error = isinstance(e, (httpx.ConnectError,
+                                           httpx.ConnectTimeout,
+                                           httpx.PoolTimeout))
+            if attempt > max_retries or not _should_retry(
+                    method, None, idempotent, connect_error):
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+        except BaseException:
+            # Cancellation included; otherwise the trial would stay taken
+            breaker.release()
+            raise
+
+        if res.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if res.status_code in RETRY_STATUSES and attempt <= max_retries and (
+                _should_retry(method, res.status_code, idempotent, False)):
+            await asyncio.sleep(retry_delay(attempt, res.headers))
+            continue
+        return res
+
+
+async def post_async(url: str, **kwargs) -> httpx.Response:
+    return await request_async("POST", url, **kwargs)
+
+
+async def get_async(url: str, **kwargs) -> httpx.Response:
+    return await request_async("GET", url, **kwargs)
+
+
+async def close_async_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+__all__ = [
+    "HTTP2_AVAILABLE", "CircuitBreaker", "CircuitOpenError",
+    "breaker_states", "close_async_client", "get", "get_async",
+    "get_async_client", "get_breaker", "get_session", "post", "post_async",
+    "request", "request_async", "retry_delay"
+]
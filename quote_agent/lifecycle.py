@@ -1,19 +1,25 @@
 from google.adk.agents.callback_context import CallbackContext
 from google.genai.types import Content, Part
-from typing import Optional
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Callable, Dict, Optional
 import os
+import threading
+import time
 
-from quote_agent.tools.orders import get_order_history
-from quote_agent.tools.catalog import (
-    preload_customer_catalog,
-    ingest_catalog_to_memory,
-)
+from quote_agent.token_manager import call_with_token, token_manager
+from quote_agent.tools.orders import load_order_history
+from quote_agent.tools.create_discounted_order import customer_addresses
+from quote_agent.tools.catalog import catalog_store
 
-B2B_TOKEN_API = "https://api-b2b.bigcommerce.com/api/io/auth/customers/storefront"
-AUTH_TOKEN = os.environ["B2B_REST_API_TOKEN"]
 CUSTOMER_ID = 25
 CHANNEL_ID = 1
+PRELOAD_STEP_TIMEOUT_SECONDS = float(
+    os.environ.get("PRELOAD_STEP_TIMEOUT_SECONDS", "10"))
+
+# Steps that time out keep running here, but their results are discarded
+_preload_pool = ThreadPoolExecutor(max_workers=16,
+                                   thread_name_prefix="preload")
 
 
 def get_session_from_callback(callback_context: CallbackContext):
@@ -31,32 +37,76 @@ def get_session_from_callback(callback_context: CallbackContext):
     return session
 
 
+# Steps run off-thread on a snapshot of these keys and return the state
+# updates to apply; only the callback's own thread writes session state
+PRELOAD_STATE_KEYS = ("b2b_storefront_token", "order_history",
+                      "catalog_version")
+
+
+def _load_order_history(state: dict) -> dict:
+    if state.get("order_history") is not None:
+        return {}
+    token = state["b2b_storefront_token"]
+    orders, fresh = call_with_token(token, load_order_history)
+    print("✅ Order history loaded.")
+    updates = {"order_history": orders} if orders else {}
+    if fresh != token:
+        updates["b2b_storefront_token"] = fresh
+    return updates
+
+
+def _preload_catalog(state: dict) -> dict:
+    # Point the session at the shared catalog version
+    version = catalog_store.get().version
+    if state.get("catalog_version") == version:
+        return {}
+    print("✅ Catalog version recorded in session state.")
+    return {"catalog_version": version}
+
+
+def _warm_billing_address(state: dict) -> dict:
+    # Negotiated orders then only need the order POST
+    customer_addresses.get(CUSTOMER_ID)
+    return {}
+
+
+PRELOAD_STEPS: Dict[str, Callable[[dict], dict]] = {
+    "order_history": _load_order_history,
+    "catalog": _preload_catalog,
+    "billing_address": _warm_billing_address,
+}
+PRELOAD_STEP_TIMEOUTS = {
+    name: float(
+        os.environ.get(f"PRELOAD_{name.upper()}_TIMEOUT_SECONDS",
+                       PRELOAD_STEP_TIMEOUT_SECONDS))
+    for name in PRELOAD_STEPS
+}
+
+
+def _submit_step(step: Callable[[dict], dict], state: dict):
+    """Submits a step and returns (future, started event, start times)."""
+    started = threading.Event()
+    started_at = {}
+
+    def run() -> dict:
+        started_at["at"] = time.monotonic()
+        started.set()
+        return step(state)
+
+    return _preload_pool.submit(run), started, started_at
+
+
 def preload_agent_context(
     callback_context: CallbackContext, ) -> Optional[Content]:
     state = callback_context.state
 
-    # get a session specific B2B Storefront token
-    print("🔑 Fetching B2B Storefront token...")
+    # get a session specific B2B Storefront token (cached per customer)
     try:
-        res = requests.post(
-            B2B_TOKEN_API,
-            json={
-                "customerId": CUSTOMER_ID,
-                "channelId": CHANNEL_ID
-            },
-            headers={
-                "Content-Type": "application/json",
-                "authToken": AUTH_TOKEN
-            },
-        )
-        print(f"📥 Token response: {res.status_code}")
-        print(res.text)
-
-        res.raise_for_status()
-        token = res.json().get("data", {}).get("token", [None])[0]
+        token = token_manager.get_token(CUSTOMER_ID, CHANNEL_ID)
         if token:
-            state["b2b_storefront_token"] = token
-            print("✅ Token saved to state.")
+            if state.get("b2b_storefront_token") != token:
+                state["b2b_storefront_token"] = token
+                print("✅ Token saved to state.")
         else:
             state["b2b_storefront_token"] = None
             return Content(role="user",
@@ -67,33 +117,32 @@ def preload_agent_context(
         return Content(role="user",
                        parts=[Part(text="❌ Failed to fetch token.")])
 
-    # Load order history
-    if "order_history" not in state:
+    # The remaining steps are independent, so run them side by side
+    started = time.monotonic()
+    snapshot = {key: state.get(key) for key in PRELOAD_STATE_KEYS}
+    runs = {
+        name: _submit_step(step, snapshot)
+        for name, step in PRELOAD_STEPS.items()
+    }
+    for name, (future, step_started, started_at) in runs.items():
+        timeout = PRELOAD_STEP_TIMEOUTS[name]
+        # Time spent queued for a worker doesn't count against the budget
+        if not step_started.wait(timeout):
+            future.cancel()
+            print(f"⏱️ Preload step '{name}' never started; skipping it.")
+            continue
+        remaining = started_at["at"] + timeout - time.monotonic()
         try:
-            get_order_history(callback_context)
-            print("✅ Order history loaded.")
+            updates = future.result(timeout=max(0.0, remaining))
+        except FuturesTimeout:
+            # Its result is dropped, so a late finish can't touch state
+            print(f"⏱️ Preload step '{name}' timed out; continuing without it.")
+            continue
         except Exception as e:
-            print(f"⚠️ Failed to load order history: {e}")
-
-    # Preload catalog into session state
-    try:
-        preload_customer_catalog(callback_context)
-        print("✅ Catalog loaded into session state.")
-    except Exception as e:
-        print(f"⚠️ Failed to preload catalog into state: {e}")
-
-    # Ingest catalog into memory using session metadata
-    try:
-        session = get_session_from_callback(callback_context)
-        if session:
-            ingest_catalog_to_memory(
-                app_name=session.app_name,
-                user_id=session.user_id,
-                session_id=session.id,
-            )
-        else:
-            print("⚠️ No session found in context. Skipping memory ingestion.")
-    except Exception as e:
-        print(f"⚠️ Failed to ingest catalog into memory: {e}")
+            print(f"⚠️ Preload step '{name}' failed: {e}")
+            continue
+        for key, value in updates.items():
+            state[key] = value
+    print(f"⚡ Preload finished in {time.monotonic() - started:.2f}s.")
 
     return None
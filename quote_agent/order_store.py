@@ -0,0 +1,307 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+ORDER_HISTORY_PAGE_SIZE = int(os.environ.get("ORDER_HISTORY_PAGE_SIZE", "50"))
+# How long a company's history is served before checking for new orders
+ORDER_HISTORY_SYNC_SECONDS = float(
+    os.environ.get("ORDER_HISTORY_SYNC_SECONDS", "60"))
+# Orders, newest first, that a range or id lookup may page through
+ORDER_LOOKUP_MAX_ORDERS = int(
+    os.environ.get("ORDER_LOOKUP_MAX_ORDERS", "1000"))
+
+# (company_id, token, after_cursor, first) -> (orders newest first, next cursor)
+OrderPageLoader = Callable[[int, str, Optional[str], int],
+                           Tuple[List[dict], Optional[str]]]
+
+
+def order_id(order: dict) -> int:
+    return int(order["orderId"])
+
+
+class OrderLookupLimitReached(Exception):
+    """A lookup ran out of its order budget before it could finish.
+
+    `orders` holds the matches found within the budget.
+    """
+
+    def __init__(self, orders: List[dict], scanned: int):
+        super().__init__(f"stopped after scanning {scanned} orders")
+        self.orders = orders
+        self.scanned = scanned
+
+
+class CompanyOrderHistory:
+    """The newest orders of one company loaded so far, newest first.
+
+    Older pages are only loaded on demand; `next_cursor` is where the next
+    older page starts and is None once the full history is held.
+    """
+
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.orders: List[dict] = []
+        self.by_id: Dict[int, dict] = {}
+        self.synced_at: Optional[float] = None
+        self.next_cursor: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    @property
+    def complete(self) -> bool:
+        return self.next_cursor is None
+
+    @property
+    def latest_id(self) -> int:
+        return order_id(self.orders[0]) if self.orders else 0
+
+    @property
+    def oldest_id(self) -> int:
+        return order_id(self.orders[-1]) if self.orders else 0
+
+    def older_than(self, oid: int, limit: int) -> List[dict]:
+        # Orders are sorted by descending id, so bisect on the negated id
+        start = bisect.bisect_right(self.orders, -oid,
+                                    key=lambda o: -order_id(o))
+        return self.orders[start:start + limit]
+
+    def append(self, older: List[dict], next_cursor: Optional[str]):
+        older = [o for o in older if order_id(o) not in self.by_id]
+        by_id = dict(self.by_id)
+        by_id.update((order_id(o), o) for o in older)
+        self.orders = self.orders + sorted(older, key=order_id, reverse=True)
+        self.by_id = by_id
+        self.next_cursor = next_cursor
+
+    def prepend(self, newer: List[dict]):
+        newer = [o for o in newer if order_id(o) not in self.by_id]
+        if not newer:
+            return
+        by_id = dict(self.by_id)
+        by_id.update((order_id(o), o) for o in newer)
+        # Swap both references so readers never see a half-updated history
+        self.orders = sorted(newer, key=order_id, reverse=True) + self.orders
+        self.by_id = by_id
+
+    def get(self, oid: int) -> Optional[dict]:
+        return self.by_id.get(int(oid))
+
+    def last(self) -> Optional[dict]:
+        return self.orders[0] if self.orders else None
+
+    def recent(self, n: int) -> List[dict]:
+        return self.orders[:max(0, n)]
+
+    def in_range(self, start: int, end: int) -> List[dict]:
+        low, high = sorted((int(start), int(end)))
+        return [o for o in self.orders if low <= order_id(o) <= high]
+
+
+class OrderHistoryStore:
+    """Process-wide order history cache keyed by company.
+
+    The first lookup for a company loads only its newest page. Older pages
+    are fetched lazily as `iter_pages` walks past what is held, so "last N"
+    and range queries load exactly the pages they need. Lookups older than
+    `sync_interval` only page through orders newer than the highest
+    bcOrderId already held, stopping at the first known order, so a sync
+    with no new orders costs a single small request.
+    """
+
+    def __init__(self,
+                 page_loader: OrderPageLoader,
+                 sync_interval: float = ORDER_HISTORY_SYNC_SECONDS,
+                 page_size: int = ORDER_HISTORY_PAGE_SIZE):
+        self._page_loader = page_loader
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        self._histories: Dict[int, CompanyOrderHistory] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def peek(self, company_id: int) -> Optional[CompanyOrderHistory]:
+        return self._histories.get(company_id)
+
+    def get(self,
+            company_id: int,
+            token: str,
+            force: bool = False) -> CompanyOrderHistory:
+        history = self._histories.get(company_id)
+        if history is not None and not force and (
+                time.time() - history.synced_at < self.sync_interval):
+            return history
+        return self._sync(company_id, token, force)
+
+    def invalidate(self, company_id: int):
+        """Forces the next lookup to check for new orders (e.g. on webhook)."""
+        history = self._histories.get(company_id)
+        if history is not None:
+            history.synced_at = 0.0
+
+    def _company_lock(self, company_id: int) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(company_id, threading.Lock())
+
+    def _sync(self, company_id: int, token: str,
+              force: bool) -> CompanyOrderHistory:
+        with self._company_lock(company_id):
+            history = self._histories.get(company_id)
+            # Someone else synced it while we waited on the lock
+            if history is not None and not force and (
+                    time.time() - history.synced_at < self.sync_interval):
+                return history
+            if history is None:
+                history = CompanyOrderHistory(company_id)
+
+            started = time.time()
+            cold = company_id not in self._histories
+            latest = history.latest_id
+            newer: List[dict] = []
+            cursor = None
+            pages = 0
+            try:
+                while True:
+                    page, cursor = self._page_loader(company_id, token, cursor,
+                                                     self.page_size)
+                    pages += 1
+                    fresh = [o for o in page if order_id(o) > latest]
+                    newer.extend(fresh)
+                    if cold:
+                        # Older pages are loaded on demand from here
+                        history.next_cursor = cursor
+                        break
+                    if len(fresh) < len(page) or not cursor:
+                        break
+            except Exception as e:
+                if company_id not in self._histories:
+                    raise
+                print(f"⚠️ Order history sync failed for company "
+                      f"{company_id}, serving cached orders: {e}")
+                return history
+
+            history.prepend(newer)
+            history.synced_at = started
+            self._histories[company_id] = history
+            print(f"🧾 Synced {len(newer)} new orders for company {company_id} "
+                  f"in {pages} pages ({len(history)} held).")
+            return history
+
+    def _load_older(self, history: CompanyOrderHistory, token: str,
+                    cursor: str):
+        with self._company_lock(history.company_id):
+            # Another reader already loaded this page while we waited
+            if history.next_cursor != cursor:
+                return
+            page, next_cursor = self._page_loader(history.company_id, token,
+                                                  cursor, self.page_size)
+            history.append(page, next_cursor)
+            print(f"🧾 Loaded {len(page)} older orders for company "
+                  f"{history.company_id} ({len(history)} held).")
+
+    def iter_pages(self, company_id: int,
+                   token: str) -> Iterator[List[dict]]:
+        """Yields the company's orders newest first, a page at a time.
+
+        Held orders are served from memory; older pages are only fetched
+        when the caller keeps iterating past them.
+        """
+        history = self.get(company_id, token)
+        last_id: Optional[int] = None
+        while True:
+            if last_id is None:
+                page = history.orders[:self.page_size]
+            else:
+                page = history.older_than(last_id, self.page_size)
+            if page:
+                last_id = order_id(page[-1])
+                yield page
+                continue
+            cursor = history.next_cursor
+            if cursor is None:
+                return
+            self._load_older(history, token, cursor)
+
+    async def aiter_pages(self, company_id: int,
+                          token: str) -> AsyncIterator[List[dict]]:
+        """Async version of `iter_pages`; page fetches run off the loop."""
+        pages = self.iter_pages(company_id, token)
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    def recent(self, company_id: int, token: str, n: int) -> List[dict]:
+        orders: List[dict] = []
+        if n <= 0:
+            return orders
+        for page in self.iter_pages(company_id, token):
+            orders.extend(page)
+            if len(orders) >= n:
+                break
+        return orders[:n]
+
+    def in_range(self,
+                 company_id: int,
+                 token: str,
+                 start: int,
+                 end: int,
+                 max_orders: int = ORDER_LOOKUP_MAX_ORDERS) -> List[dict]:
+        """Orders with ids in [start, end], newest first.
+
+        Raises OrderLookupLimitReached once `max_orders` have been scanned
+        and older orders could still fall in the range.
+        """
+        low, high = sorted((int(start), int(end)))
+        orders: List[dict] = []
+        scanned = 0
+        for page in self.iter_pages(company_id, token):
+            orders.extend(o for o in page if low <= order_id(o) <= high)
+            if order_id(page[-1]) <= low:
+                break
+            scanned += len(page)
+            history = self.peek(company_id)
+            if scanned >= max_orders and not (
+                    history.complete
+                    and order_id(page[-1]) == history.oldest_id):
+                raise OrderLookupLimitReached(orders, scanned)
+        return orders
+
+    def find(self,
+             company_id: int,
+             token: str,
+             ids: Iterable[int],
+             max_orders: int = ORDER_LOOKUP_MAX_ORDERS) -> List[dict]:
+        """Looks up specific orders, newest first, skipping unknown ids.
+
+        Older pages are only loaded while some id is still older than every
+        order held, so a lookup stops as soon as each id is found or passed.
+        Raises OrderLookupLimitReached if that would mean holding more than
+        `max_orders`.
+        """
+        wanted = sorted({int(oid) for oid in ids}, reverse=True)
+        history = self.get(company_id, token)
+        while True:
+            found = [history.get(oid) for oid in wanted if history.get(oid)]
+            missing = [oid for oid in wanted if history.get(oid) is None]
+            cursor = history.next_cursor
+            if not missing or cursor is None or (min(missing) >=
+                                                 history.oldest_id):
+                return found
+            if len(history) >= max_orders:
+                raise OrderLookupLimitReached(found, len(history))
+            self._load_older(history, token, cursor)
+
+    def all(self, company_id: int, token: str) -> List[dict]:
+        return [o for page in self.iter_pages(company_id, token) for o in page]
+
+
+__all__ = [
+    "CompanyOrderHistory", "OrderHistoryStore", "OrderLookupLimitReached",
+    "order_id"
+]
@@ -0,0 +1,171 @@
+import os
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CENT = Decimal("0.01")
+
+
+def _parse_tiers(spec: str) -> List[Tuple[int, float]]:
+    """Parses "50:2,100:5" into [(50, 2.0), (100, 5.0)]."""
+    tiers = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        quantity, percent = part.split(":")
+        tiers.append((int(quantity), float(percent)))
+    return sorted(tiers)
+
+
+# Extra discount (percentage points) for lines of at least N units, e.g.
+# "50:2,100:5"; empty means no volume tiers
+PRICING_QUANTITY_TIERS = _parse_tiers(
+    os.environ.get("PRICING_QUANTITY_TIERS", ""))
+
+# Discounts above this fraction need a quote for approval. Config reads it
+# from here; importing Config itself requires the full API environment
+DISCOUNT_THRESHOLD = 0.05
+
+CartLines = Sequence[Tuple[int, int]]
+
+
+class PricingError(ValueError):
+    pass
+
+
+def to_pence(price) -> int:
+    """Converts a catalog price to integer pence, rounding half up."""
+    return int(Decimal(str(price)).quantize(CENT, ROUND_HALF_UP) * 100)
+
+
+def to_money(pence: int) -> Decimal:
+    return (Decimal(int(pence)) / 100).quantize(CENT)
+
+
+def _basis_points(percent: float) -> int:
+    return int(Decimal(str(percent)).scaleb(2).quantize(Decimal(1),
+                                                         ROUND_HALF_UP))
+
+
+def route_for_discount(discount_bp: int) -> str:
+    """Routes on the discount granted, in basis points, not on the rounded
+    money amounts, so a 5% discount stays an order at a 5% threshold."""
+    threshold_bp = _basis_points(DISCOUNT_THRESHOLD * 100)
+    return "order" if discount_bp <= threshold_bp else "quote"
+
+
+def price_arrays(unit_pence: np.ndarray, quantities: np.ndarray,
+                 discount_bp: np.ndarray,
+                 tiers: Sequence[Tuple[int, float]] = PRICING_QUANTITY_TIERS
+                 ) -> Dict[str, np.ndarray]:
+    """Prices any number of lines at once in integer pence.
+
+    Per-unit discounts are rounded half up to the penny, as on a quote, and
+    line totals are exact multiples of them.
+    """
+    bp = discount_bp.astype(np.int64)
+    for min_quantity, percent in tiers:
+        bp = bp + np.where(quantities >= min_quantity,
+                           _basis_points(percent), 0)
+    bp = np.clip(bp, 0, 10000)
+    unit_discount = (unit_pence * bp + 5000) // 10000
+    return {
+        "discount_bp": bp,
+        "unit_discount": unit_discount,
+        "offered": unit_pence - unit_discount,
+        "line_subtotal": unit_pence * quantities,
+        "line_discount": unit_discount * quantities,
+    }
+
+
+def price_carts(carts: Sequence[CartLines],
+                discount_percents: Sequence[float],
+                catalog,
+                tiers: Sequence[Tuple[int, float]] = PRICING_QUANTITY_TIERS
+                ) -> List[dict]:
+    """Prices many carts of (product_id, quantity) lines in one pass.
+
+    Carts referencing unknown or unpriced products come back as
+    {"error": ...}; the rest are priced together.
+    """
+    results: List[Optional[dict]] = [None] * len(carts)
+    cart_index, product_ids, unit_pence, quantities, discount_bp = (
+        [], [], [], [], [])
+    for i, (lines, percent) in enumerate(zip(carts, discount_percents)):
+        try:
+            prices = []
+            for product_id, quantity in lines:
+                product = catalog.get(product_id)
+                if not product:
+                    raise PricingError(
+                        f"Product {product_id} not found in catalog.")
+                if not product.get("price"):
+                    raise PricingError(f"Product {product_id} missing price.")
+                prices.append(to_pence(product["price"]))
+        except PricingError as e:
+            results[i] = {"error": str(e)}
+            continue
+        bp = _basis_points(percent)
+        for (product_id, quantity), pence in zip(lines, prices):
+            cart_index.append(i)
+            product_ids.append(int(product_id))
+            unit_pence.append(pence)
+            quantities.append(int(quantity))
+            discount_bp.append(bp)
+
+    cart_index = np.asarray(cart_index, dtype=np.int64)
+    quantities_arr = np.asarray(quantities, dtype=np.int64)
+    priced = price_arrays(np.asarray(unit_pence, dtype=np.int64),
+                          quantities_arr, np.asarray(discount_bp,
+                                                     dtype=np.int64), tiers)
+    # np.add.at keeps the per-cart sums in exact integer pence
+    subtotals = np.zeros(len(carts), dtype=np.int64)
+    discounts = np.zeros(len(carts), dtype=np.int64)
+    # Requested plus tier discount of each cart's most discounted line
+    applied_bp = np.zeros(len(carts), dtype=np.int64)
+    np.add.at(subtotals, cart_index, priced["line_subtotal"])
+    np.add.at(discounts, cart_index, priced["line_discount"])
+    np.maximum.at(applied_bp, cart_index, priced["discount_bp"])
+
+    lines_by_cart: Dict[int, List[dict]] = {}
+    for row, i in enumerate(cart_index.tolist()):
+        lines_by_cart.setdefault(i, []).append({
+            "product_id": product_ids[row],
+            "quantity": quantities[row],
+            "unit_price": to_money(unit_pence[row]),
+            "unit_discount": to_money(priced["unit_discount"][row]),
+            "offered_price": to_money(priced["offered"][row]),
+            "discount_percent": int(priced["discount_bp"][row]) / 100,
+            "line_total": to_money(priced["line_subtotal"][row] -
+                                   priced["line_discount"][row]),
+        })
+
+    for i, percent in enumerate(discount_percents):
+        if results[i] is not None:
+            continue
+        subtotal, discount = int(subtotals[i]), int(discounts[i])
+        fraction = discount / subtotal if subtotal else 0.0
+        results[i] = {
+            "lines": lines_by_cart.get(i, []),
+            "discount_percent": percent,
+            "applied_discount_percent": int(applied_bp[i]) / 100,
+            "effective_discount_percent": round(fraction * 100, 2),
+            "subtotal": to_money(subtotal),
+            "discount": to_money(discount),
+            "grand_total": to_money(subtotal - discount),
+            "route": route_for_discount(int(applied_bp[i]))
+        }
+    return results
+
+
+def price_cart(lines: CartLines, discount_percent: float, catalog) -> dict:
+    """Prices a single cart; raises PricingError if it can't be priced."""
+    result = price_carts([lines], [discount_percent], catalog)[0]
+    if "error" in result:
+        raise PricingError(result["error"])
+    return result
+
+
+__all__ = [
+    "PricingError", "price_arrays", "price_cart", "price_carts",
+    "route_for_discount", "to_money", "to_pence"
+]
@@ -0,0 +1,84 @@
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from cachetools import LRUCache, TTLCache
+
+PRODUCT_METADATA_CACHE_SIZE = int(
+    os.environ.get("PRODUCT_METADATA_CACHE_SIZE", "2048"))
+# How long ids the Storefront didn't return (deleted/invisible) are
+# remembered as absent before being asked for again
+PRODUCT_METADATA_NEGATIVE_TTL = float(
+    os.environ.get("PRODUCT_METADATA_NEGATIVE_TTL", "300"))
+
+MetadataFetcher = Callable[[List[int]], Awaitable[Dict[int, dict]]]
+
+
+class ProductMetadataCache:
+    """Product lookups for order-line enrichment.
+
+    Products are read from the shared catalog first. Products the catalog
+    doesn't hold (e.g. hidden or not yet synced) are fetched in one batched
+    call and kept in an LRU, so repeat lookups don't hit the network. Ids
+    the fetch doesn't return are remembered as absent for `negative_ttl`.
+    """
+
+    def __init__(self,
+                 catalog_source: Callable[[], Optional[object]],
+                 fetcher: MetadataFetcher,
+                 maxsize: int = PRODUCT_METADATA_CACHE_SIZE,
+                 negative_ttl: float = PRODUCT_METADATA_NEGATIVE_TTL):
+        self._catalog_source = catalog_source
+        self._fetcher = fetcher
+        self._recent: LRUCache = LRUCache(maxsize=maxsize)
+        self._absent: TTLCache = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, product_ids: Iterable[int]) -> Dict[int, dict]:
+        catalog = self._catalog_source()
+        found: Dict[int, dict] = {}
+        missing: List[int] = []
+        with self._lock:
+            for pid in dict.fromkeys(int(pid) for pid in product_ids):
+                product = catalog.get(pid) if catalog is not None else None
+                if product is None:
+                    product = self._recent.get(pid)
+                if product is None and pid in self._absent:
+                    continue
+                if product is None:
+                    missing.append(pid)
+                else:
+                    found[pid] = product
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = await self._fetcher(missing)
+            with self._lock:
+                for pid, product in fetched.items():
+                    self._recent[pid] = product
+                for pid in missing:
+                    if pid not in fetched:
+                        self._absent[pid] = True
+            found.update(fetched)
+        return found
+
+    def invalidate(self, product_ids: Iterable[int]):
+        with self._lock:
+            for pid in product_ids:
+                self._recent.pop(int(pid), None)
+                self._absent.pop(int(pid), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached": len(self._recent),
+                "absent": len(self._absent)
+            }
+
+
+__all__ = ["ProductMetadataCache"]
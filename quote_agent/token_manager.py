@@ -0,0 +1,191 @@
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar
+
+from quote_agent.http_client import post
+
+B2B_TOKEN_API = "https://api-b2b.bigcommerce.com/api/io/auth/customers/storefront"
+# Used when a token carries no readable `exp` claim
+B2B_TOKEN_DEFAULT_TTL_SECONDS = float(
+    os.environ.get("B2B_TOKEN_DEFAULT_TTL_SECONDS", "3600"))
+# Tokens are refreshed in the background once this close to expiry
+B2B_TOKEN_REFRESH_MARGIN_SECONDS = float(
+    os.environ.get("B2B_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+TokenKey = Tuple[int, int]
+T = TypeVar("T")
+
+
+class TokenRejected(Exception):
+    """The B2B API answered 401 for the token a request carried."""
+
+
+def check_token_response(res):
+    if res.status_code == 401:
+        raise TokenRejected("B2B token rejected")
+
+
+def fetch_storefront_token(customer_id: int, channel_id: int) -> Optional[str]:
+    res = post(
+        B2B_TOKEN_API,
+        json={
+            "customerId": customer_id,
+            "channelId": channel_id
+        },
+        headers={
+            "Content-Type": "application/json",
+            "authToken": os.environ["B2B_REST_API_TOKEN"]
+        },
+        timeout=(5, 15),
+        idempotent=True,
+    )
+    print(f"📥 Token response: {res.status_code}")
+    res.raise_for_status()
+    return res.json().get("data", {}).get("token", [None])[0]
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """Reads the `exp` claim of a JWT without verifying it."""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except Exception:
+        return None
+
+
+class StorefrontTokenManager:
+    """Caches B2B storefront tokens per (customer, channel).
+
+    A cached token is returned without any network call. Once it is within
+    `refresh_margin` of expiry a single background refresh is started, and
+    concurrent callers that need a token fetched synchronously share one
+    request per key.
+    """
+
+    def __init__(self,
+                 fetcher: Callable[[int, int],
+                                   Optional[str]] = fetch_storefront_token,
+                 default_ttl: float = B2B_TOKEN_DEFAULT_TTL_SECONDS,
+                 refresh_margin: float = B2B_TOKEN_REFRESH_MARGIN_SECONDS):
+        self._fetcher = fetcher
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[TokenKey, Tuple[str, float]] = {}
+        # token -> (key, expires_at), so a rejected token can be renewed
+        self._owners: Dict[str, Tuple[TokenKey, float]] = {}
+        self._key_locks: Dict[TokenKey, threading.Lock] = {}
+        self._refreshing: Set[TokenKey] = set()
+        self._lock = threading.Lock()
+
+    def get_token(self, customer_id: int, channel_id: int) -> Optional[str]:
+        key = (customer_id, channel_id)
+        cached = self._tokens.get(key)
+        now = time.time()
+        if cached and now < cached[1]:
+            if cached[1] - now <= self.refresh_margin:
+                self._refresh_in_background(key)
+            return cached[0]
+        return self._fetch(key, stale=cached)
+
+    def invalidate(self, customer_id: int, channel_id: int):
+        self._tokens.pop((customer_id, channel_id), None)
+
+    def renew(self, token: str) -> Optional[str]:
+        """Drops a token the API rejected and returns a fresh one for the
+        same (customer, channel), or None if the token isn't ours."""
+        owner = self._owners.get(token)
+        if owner is None:
+            return None
+        key = owner[0]
+        with self._key_lock(key):
+            cached = self._tokens.get(key)
+            if cached and cached[0] == token:
+                self.invalidate(*key)
+        # Returns a replacement another caller already fetched, if any
+        return self._fetch(key)
+
+    def _key_lock(self, key: TokenKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, key: TokenKey, stale=None) -> Optional[str]:
+        with self._key_lock(key):
+            cached = self._tokens.get(key)
+            # Someone else refreshed it while we waited on the lock
+            if cached is not stale and cached and time.time() < cached[1]:
+                return cached[0]
+
+            print("🔑 Fetching B2B Storefront token...")
+            token = self._fetcher(*key)
+            if not token:
+                return None
+            now = time.time()
+            expires_at = token_expiry(token) or now + self.default_ttl
+            self._tokens[key] = (token, expires_at)
+            with self._lock:
+                for old in [t for t, (_, exp) in self._owners.items()
+                            if exp <= now]:
+                    del self._owners[old]
+                self._owners[token] = (key, expires_at)
+            return token
+
+    def _refresh_in_background(self, key: TokenKey):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, stale=self._tokens.get(key))
+            except Exception as e:
+                print(f"⚠️ Background token refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="b2b-token-refresh",
+                         daemon=True).start()
+
+
+token_manager = StorefrontTokenManager()
+
+
+def call_with_token(token: str, call: Callable[[str], T]) -> Tuple[T, str]:
+    """Runs `call(token)`, renewing the token and retrying once if the B2B
+    API rejects it. Returns the result and the token that was used."""
+    try:
+        return call(token), token
+    except TokenRejected:
+        fresh = token_manager.renew(token)
+        if not fresh:
+            raise
+        print("🔑 B2B token rejected; retrying with a fresh one.")
+        return call(fresh), fresh
+
+
+async def call_with_token_async(
+        token: str, call: Callable[[str], Awaitable[T]]) -> Tuple[T, str]:
+    try:
+        return await call(token), token
+    except TokenRejected:
+        fresh = await asyncio.to_thread(token_manager.renew, token)
+        if not fresh:
+            raise
+        print("🔑 B2B token rejected; retrying with a fresh one.")
+        return await call(fresh), fresh
+
+
+__all__ = [
+    "StorefrontTokenManager", "TokenRejected", "call_with_token",
+    "call_with_token_async", "check_token_response", "fetch_storefront_token",
+    "token_expiry", "token_manager"
+]
@@ -0,0 +1,172 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+import asyncio
+import os
+import time
+
+from quote_agent.pricing import price_carts
+from quote_agent.tools.catalog import catalog_store
+from quote_agent.tools.create_discounted_order import (ProductItem,
+                                                       build_order_payload,
+                                                       customer_addresses,
+                                                       submit_order)
+from quote_agent.tools.create_quote import (DEFAULT_QUOTE_ACCOUNT,
+                                            CombinedQuoteArgs, ProductInput,
+                                            QuoteAccount, build_quote_payload,
+                                            submit_quote)
+
+BULK_SUBMIT_CONCURRENCY = int(os.environ.get("BULK_SUBMIT_CONCURRENCY", "4"))
+DEFAULT_CUSTOMER_ID = 25
+
+
+class BulkCart(BaseModel):
+    kind: Literal["quote", "order"]
+    products: List[ProductInput]
+    discount_percent: float
+    note: str = ""
+    customer_id: int = DEFAULT_CUSTOMER_ID
+    # Company/contact a quote is filed under; required for quotes unless
+    # the cart is for the default customer
+    account: Optional[QuoteAccount] = None
+
+
+async def _prepare_carts(carts: List[dict], catalog) -> List[dict]:
+    """Validates and prices every cart before anything is submitted."""
+    prepared = []
+    for index, raw in enumerate(carts):
+        try:
+            cart = BulkCart(**raw)
+            if not cart.products:
+                raise ValueError("Cart has no products.")
+            if (cart.kind == "quote" and cart.account is None
+                    and cart.customer_id != DEFAULT_CUSTOMER_ID):
+                raise ValueError(
+                    f"Quote for customer {cart.customer_id} needs an account.")
+        except Exception as e:
+            prepared.append({"index": index, "error": f"Invalid input: {e}"})
+            continue
+        prepared.append({"index": index, "cart": cart})
+
+    # Billing addresses come from the shared cache; fetch misses together
+    customer_ids = {
+        p["cart"].customer_id
+        for p in prepared if "cart" in p and p["cart"].kind == "order"
+    }
+    addresses = dict(
+        zip(
+            customer_ids, await
+            asyncio.gather(*(customer_addresses.get_async(cid)
+                             for cid in customer_ids),
+                           return_exceptions=True)))
+
+    # Price every valid cart in a single batched pass
+    valid = [entry for entry in prepared if "cart" in entry]
+    pricings = price_carts([[(p.product_id, p.quantity)
+                             for p in entry["cart"].products]
+                            for entry in valid],
+                           [entry["cart"].discount_percent for entry in valid],
+                           catalog)
+
+    for entry, pricing in zip(valid, pricings):
+        cart = entry.pop("cart")
+        entry["kind"] = cart.kind
+        try:
+            if "error" in pricing:
+                raise ValueError(pricing["error"])
+            if cart.kind == "quote":
+                entry["payload"] = build_quote_payload(
+                    CombinedQuoteArgs(products=cart.products,
+                                      note=cart.note,
+                                      discount_percent=cart.discount_percent),
+                    catalog, pricing, cart.account or DEFAULT_QUOTE_ACCOUNT)
+            else:
+                address = addresses.get(cart.customer_id)
+                if isinstance(address, Exception):
+                    raise ValueError(f"Address fetch failed: {address}")
+                if not address:
+                    raise ValueError("No billing address found")
+                entry["payload"] = build_order_payload(
+                    [ProductItem(**p.dict()) for p in cart.products],
+                    cart.discount_percent, catalog, address,
+                    cart.customer_id, pricing)
+        except Exception as e:
+            entry["error"] = str(e)
+    return prepared
+
+
+async def submit_carts(carts: List[dict],
+                       catalog=None,
+                       allow_partial: bool = False,
+                       concurrency: int = BULK_SUBMIT_CONCURRENCY) -> dict:
+    """Validates, prices and submits many quote/order carts in one call.
+
+    Every cart is validated and priced against the catalog first. Unless
+    `allow_partial` is set, a single invalid cart rejects the whole batch
+    before anything is sent. Valid carts are then submitted with at most
+    `concurrency` requests in flight.
+
+    Carts may name any customer, so this is for internal/admin callers
+    only and is deliberately not exposed as an agent tool.
+    """
+    started = time.perf_counter()
+    catalog = catalog or catalog_store.get()
+    prepared = await _prepare_carts(carts, catalog)
+    validated = time.perf_counter()
+
+    invalid = [p for p in prepared if "error" in p]
+    results = [{
+        "index": p["index"],
+        "status": "invalid",
+        "message": p["error"]
+    } for p in invalid]
+    if invalid and not allow_partial:
+        return {
+            "status": "rejected",
+            "message": f"{len(invalid)} of {len(carts)} carts are invalid; "
+            "nothing was submitted.",
+            "results": results,
+            "timing": {
+                "validate_seconds": round(validated - started, 3)
+            }
+        }
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def submit(entry: dict) -> dict:
+        async with semaphore:
+            cart_started = time.perf_counter()
+            if entry["kind"] == "quote":
+                result = await submit_quote(entry["payload"])
+            else:
+                result = await submit_order(entry["payload"])
+        return {
+            "index": entry["index"],
+            "kind": entry["kind"],
+            **result, "seconds":
+            round(time.perf_counter() - cart_started, 3)
+        }
+
+    valid = [p for p in prepared if "error" not in p]
+    results.extend(await asyncio.gather(*(submit(p) for p in valid)))
+    results.sort(key=lambda r: r["index"])
+    finished = time.perf_counter()
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    return {
+        "status": "success" if succeeded == len(carts) else
+        "partial" if succeeded else "error",
+        "submitted": len(valid),
+        "succeeded": succeeded,
+        "failed": len(carts) - succeeded,
+        "results": results,
+        "timing": {
+            "validate_seconds": round(validated - started, 3),
+            "submit_seconds": round(finished - validated, 3),
+            "total_seconds": round(finished - started, 3),
+            "slowest_cart_seconds": max(
+                (r.get("seconds", 0) for r in results), default=0)
+        }
+    }
+
+
+__all__ = ["BulkCart", "submit_carts"]
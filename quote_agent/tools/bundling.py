@@ -1,11 +1,34 @@
 from typing import List, Dict
+from collections import Counter
 from pydantic import BaseModel
+import json
+import os
+import re
 from google.adk.agents import Agent
 from google.adk.tools import ToolContext, FunctionTool
 from google.adk.tools.agent_tool import AgentTool
 from quote_agent.prompts import upsell_instructions, suggest_bundle_instructions
-from quote_agent.tools.catalog import search_catalog_memory_tool, get_price_by_product_id_tool
-from difflib import get_close_matches
+from quote_agent.bundle_index import BundleIndexStore, field_key
+from quote_agent.order_store import order_id
+from quote_agent.token_manager import call_with_token, token_manager
+from quote_agent.tools.catalog import (
+    catalog_store,
+    search_catalog_memory_tool,
+    get_price_by_product_id_tool,
+    resolve_catalog,
+)
+from quote_agent.tools.orders import COMPANY_ID, load_order_lines, order_store
+
+FUZZY_TOP_K = 5
+# Pre-filter scores at or above YES, or below NO, are answered without the LLM
+BUNDLE_YES_THRESHOLD = float(os.environ.get("BUNDLE_YES_THRESHOLD", "0.7"))
+BUNDLE_NO_THRESHOLD = float(os.environ.get("BUNDLE_NO_THRESHOLD", "0.3"))
+# Most recent orders mined for co-purchases by the bundle index job
+BUNDLE_INDEX_MAX_ORDERS = int(os.environ.get("BUNDLE_INDEX_MAX_ORDERS", "500"))
+BUNDLE_TOP_K = 5
+# Storefront customer whose token the background job uses (as in lifecycle)
+BUNDLE_INDEX_CUSTOMER_ID = 25
+BUNDLE_INDEX_CHANNEL_ID = 1
 
 
 def get_bundle_label(value: str | None) -> str:
@@ -18,28 +41,113 @@ def get_bundle_label(value: str | None) -> str:
     }.get(value or "", "📦 Suggested Bundle")
 
 
+BUNDLE_FIELD_WEIGHTS = {
+    "bundle_type": 0.35,
+    "project_type": 0.2,
+    "usage_class": 0.1,
+    "material_group": 0.1,
+}
+# Metadata alone stays below BUNDLE_YES_THRESHOLD; a local yes also needs
+# something in the user's own words
+BUNDLE_FIELD_SCORE_CAP = 0.6
+BUNDLE_POSITIVE_TEXT = re.compile(
+    r"\b(bundles?|kits?|projects?|jobs?|install\w*|fit[- ]?out|refurb\w*"
+    r"|also need|what else|other (gear|tools|items)|accessor(y|ies)"
+    r"|fittings|everything (i|we) need)\b")
+BUNDLE_NEGATIVE_TEXT = re.compile(
+    r"\b(just|only|no thanks|that'?s all|nothing else|status|invoice"
+    r"|track\w*|deliver\w*|refund|cancel\w*)\b")
+
+_bundle_stats = Counter()
+
+
+def _bundle_fields(product: dict) -> Dict[str, str]:
+    return {
+        field_key(cf["name"]): cf["value"]
+        for cf in product.get("custom_fields") or []
+        if field_key(cf["name"]) in BUNDLE_FIELD_WEIGHTS
+    }
+
+
+def score_bundle_relevance(products: List[dict], user_text: str) -> dict:
+    """Deterministic 0–1 score for whether a bundle is worth offering."""
+    reasons = []
+    field_score = 0.0
+    shared = Counter()
+    for product in products:
+        fields = _bundle_fields(product)
+        score = 0.0
+        for key, value in fields.items():
+            weight = BUNDLE_FIELD_WEIGHTS[key]
+            # Bundle types we have a label for are the strongest signal
+            if key == "bundle_type" and get_bundle_label(
+                    value) == get_bundle_label(None):
+                weight /= 2
+            score += weight
+            if key in ("bundle_type", "project_type"):
+                shared[(key, value)] += 1
+        if score > field_score:
+            field_score = score
+            reasons = [f"{product.get('name')}: {k}={v}"
+                       for k, v in fields.items()]
+    if any(count > 1 for count in shared.values()):
+        field_score += 0.1
+        reasons.append("products share a bundle/project type")
+    field_score = min(field_score, BUNDLE_FIELD_SCORE_CAP)
+
+    text = (user_text or "").lower()
+    text_score = 0.0
+    if BUNDLE_POSITIVE_TEXT.search(text):
+        text_score += 0.3
+        reasons.append("user mentions a project or related items")
+    if BUNDLE_NEGATIVE_TEXT.search(text):
+        text_score -= 0.4
+        reasons.append("user wants only the listed items")
+
+    return {
+        "score": round(max(0.0, min(1.0, field_score + text_score)), 3),
+        "reasons": reasons
+    }
+
+
+def bundle_prefilter_stats() -> dict:
+    total = sum(_bundle_stats.values())
+    local = _bundle_stats["local_yes"] + _bundle_stats["local_no"]
+    return {
+        **_bundle_stats, "total": total,
+        "local_hit_rate": round(local / total, 3) if total else 0.0
+    }
+
+
 def map_skus_to_product_ids(catalog: List[Dict], skus: List[str]) -> List[int]:
     sku_lookup = {p["sku"]: p["id"] for p in catalog}
     return [sku_lookup[sku] for sku in skus if sku in sku_lookup]
 
 
 def find_product_id_by_name(name: str, tool_context: ToolContext) -> dict:
-    catalog = tool_context.state.get("catalog", [])
-    name_lower = name.lower()
+    catalog = resolve_catalog(tool_context)
 
-    for p in catalog:
-        if name_lower in p.get("name", "").lower():
-            return {"product_id": p["id"], "matched_name": p["name"]}
+    exact = catalog.get_by_name(name)
+    if exact:
+        return {
+            "product_id": exact["id"],
+            "matched_name": exact["name"],
+            "score": 1.0
+        }
 
-    #fuzzy title match
-    names = [p["name"] for p in catalog]
-    matches = get_close_matches(name, names, n=1, cutoff=0.6)
+    matches = catalog.name_index.search(name, k=FUZZY_TOP_K)
     if matches:
-        matched_name = matches[0]
-        matched_product = next(p for p in catalog if p["name"] == matched_name)
+        candidates = [{
+            "product_id": product_id,
+            "name": catalog.get(product_id)["name"],
+            "score": score
+        } for product_id, score in matches]
+        best = candidates[0]
         return {
-            "product_id": matched_product["id"],
-            "matched_name": matched_name
+            "product_id": best["product_id"],
+            "matched_name": best["name"],
+            "score": best["score"],
+            "candidates": candidates
         }
 
     return {"error": f"No matching product found for '{name}'"}
@@ -61,6 +169,77 @@ class SuggestBundlesArgs(BaseModel):
     products: List[ProductMetadata]
 
 
+# Order lines never change once placed, so each order is fetched only once;
+# orders that fall out of the mined window are evicted
+_order_baskets: Dict[int, List[int]] = {}
+
+
+def _load_order_baskets() -> List[List[int]]:
+    token = token_manager.get_token(BUNDLE_INDEX_CUSTOMER_ID,
+                                    BUNDLE_INDEX_CHANNEL_ID)
+    if not token:
+        raise RuntimeError("No B2B storefront token for the bundle index.")
+    recent, token = call_with_token(
+        token,
+        lambda t: order_store.recent(COMPANY_ID, t, BUNDLE_INDEX_MAX_ORDERS))
+    order_ids = [order_id(o) for o in recent]
+    window = set(order_ids)
+    for oid in [oid for oid in _order_baskets if oid not in window]:
+        del _order_baskets[oid]
+    missing = [oid for oid in order_ids if oid not in _order_baskets]
+    if missing:
+        lines_by_order, _ = call_with_token(
+            token, lambda t: load_order_lines(missing, t))
+        for oid, lines in lines_by_order.items():
+            _order_baskets[oid] = [
+                int(line["productId"]) for line in lines
+                if line.get("productId")
+            ]
+    return [_order_baskets.get(oid, []) for oid in order_ids]
+
+
+bundle_index_store = BundleIndexStore(_load_order_baskets, catalog_store.get)
+
+
+def get_bundle_complements(product_ids: List[int],
+                           tool_context: ToolContext) -> dict:
+    catalog = resolve_catalog(tool_context)
+    index = bundle_index_store.get()
+    bundle_types = index.bundle_types(product_ids)
+    label = get_bundle_label(
+        bundle_types.most_common(1)[0][0] if bundle_types else None)
+
+    complements = []
+    for match in index.complements(product_ids, k=BUNDLE_TOP_K * 2):
+        product = catalog.get(match["product_id"])
+        # Skip products that are no longer in the catalog or have no price
+        if not product or product.get("price") is None:
+            continue
+        complements.append({
+            "product_id": product["id"],
+            "name": product.get("name"),
+            "price": product.get("price"),
+            "currency": product.get("currency"),
+            "score": match["score"],
+            "reasons": match["reasons"]
+        })
+        if len(complements) == BUNDLE_TOP_K:
+            break
+
+    if not complements:
+        return {
+            "status": "not_found",
+            "message": "No bundle complements found for these products."
+        }
+    return {
+        "status": "success",
+        "bundle_label": label,
+        "complements": complements
+    }
+
+
+get_bundle_complements_tool = FunctionTool(func=get_bundle_complements)
+
 should_offer_bundle_agent = Agent(
     name="should_offer_bundle_agent",
     model="gemini-2.0-flash",
@@ -78,17 +257,68 @@ suggest_bundle_agent = Agent(
     "Suggests persuasive bundles using user message and catalog metadata.",
     instruction=suggest_bundle_instructions,
     tools=[
-        search_catalog_memory_tool, find_product_id_by_name_tool,
-        get_price_by_product_id_tool
+        get_bundle_complements_tool, search_catalog_memory_tool,
+        find_product_id_by_name_tool, get_price_by_product_id_tool
     ])
 
-should_offer_bundle_tool = AgentTool(agent=should_offer_bundle_agent)
+should_offer_bundle_llm_tool = AgentTool(agent=should_offer_bundle_agent)
+
+
+async def should_offer_bundle(product_ids: List[int], user_text: str,
+                              tool_context: ToolContext) -> dict:
+    catalog = resolve_catalog(tool_context)
+    products = [p for p in (catalog.get(pid) for pid in product_ids) if p]
+    result = score_bundle_relevance(products, user_text)
+    score = result["score"]
+
+    if score >= BUNDLE_YES_THRESHOLD or score < BUNDLE_NO_THRESHOLD:
+        offer = score >= BUNDLE_YES_THRESHOLD
+        _bundle_stats["local_yes" if offer else "local_no"] += 1
+        return {
+            "offer_bundle": offer,
+            "reason": "; ".join(result["reasons"])
+            or "No bundle-related metadata or user intent.",
+            "score": score,
+            "decided_by": "rules"
+        }
+
+    # Borderline: let the LLM judge from the same products and user text
+    _bundle_stats["llm"] += 1
+    request = json.dumps({
+        "user_text":
+        user_text,
+        "products": [{
+            "id": p["id"],
+            "name": p.get("name"),
+            "custom_fields": p.get("custom_fields") or []
+        } for p in products]
+    })
+    decision = await should_offer_bundle_llm_tool.run_async(
+        args={"request": request}, tool_context=tool_context)
+    raw = decision
+    if isinstance(decision, str):
+        try:
+            decision = json.loads(
+                decision.strip().removeprefix("```json").strip("`"))
+        except ValueError:
+            decision = None
+    if not (isinstance(decision, dict)
+            and isinstance(decision.get("offer_bundle"), bool)):
+        decision = {"offer_bundle": False, "reason": str(raw)}
+    return {**decision, "score": score, "decided_by": "llm"}
+
+
+should_offer_bundle_tool = FunctionTool(func=should_offer_bundle)
 suggest_bundle_tool = AgentTool(agent=suggest_bundle_agent)
 
 __all__ = [
     "should_offer_bundle_tool",
     "suggest_bundle_tool",
     "find_product_id_by_name_tool",
+    "get_bundle_complements_tool",
+    "bundle_index_store",
     "get_bundle_label",
     "map_skus_to_product_ids",
+    "score_bundle_relevance",
+    "bundle_prefilter_stats",
 ]
@@ -1,143 +1,185 @@
+import asyncio
 import os
-import uuid
-import requests
-from time import sleep
-from typing import List
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from google.adk.tools import ToolContext, FunctionTool
-from google.adk.events import Event
 from google.genai.types import Content, Part
-from google.adk.sessions import Session
-from google.adk.memory import InMemoryMemoryService
-from google.adk.memory.base_memory_service import MemoryResult
 
-memory_service = InMemoryMemoryService()
+from quote_agent.catalog_fetcher import (PRODUCTS_BY_ENTITY_IDS_QUERY,
+                                         STOREFRONT_MAX_PAGE_SIZE,
+                                         CatalogFetcher,
+                                         normalize_product_node)
+from quote_agent.catalog_search import product_search_text
+from quote_agent.catalog_store import Catalog, CatalogStore
+from quote_agent.http_client import post_async
+from quote_agent.product_metadata import ProductMetadataCache
 
-STOREFRONT_GRAPHQL_ENDPOINT = f"https://store-{os.environ.get('BIGCOMMERCE_STORE_HASH', 'MISSING')}.mybigcommerce.com/graphql"
+SEARCH_TOP_K = int(os.environ.get("CATALOG_SEARCH_TOP_K", "10"))
+# "paginated" walks the full products connection; "entity_ids" fetches the
+# fixed example ID range
+CATALOG_SYNC_MODE = os.environ.get("CATALOG_SYNC_MODE", "paginated")
 
+STOREFRONT_GRAPHQL_ENDPOINT = f"https://store-{os.environ.get('BIGCOMMERCE_STORE_HASH', 'MISSING')}.mybigcommerce.com/graphql"
+CATALOG_REST_PRODUCTS_URL = f"https://api.bigcommerce.com/stores/{os.environ.get('BIGCOMMERCE_STORE_HASH', 'MISSING')}/v3/catalog/products"
 
-def chunked(iterable, size):
-    for i in range(0, len(iterable), size):
-        yield iterable[i:i + size]
+catalog_fetcher = CatalogFetcher(STOREFRONT_GRAPHQL_ENDPOINT)
 
 
-def _load_catalog_data() -> List[dict]:
+def _storefront_headers() -> Optional[dict]:
     token = os.environ.get("BIGCOMMERCE_STOREFRONT_API_TOKEN")
     if not token:
         print("❌ BIGCOMMERCE_STOREFRONT_API_TOKEN is missing.")
-        return []
-
-    headers = {
+        return None
+    return {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {token}"
     }
 
-    query = """
-    query getProductsByEntityIds($entityIds: [Int!]!) {
-      site {
-        products(entityIds: $entityIds) {
-          edges {
-            node {
-              entityId
-              name
-              sku
-              description
-              path
-              defaultImage {
-                url640wide: url(width: 640)
-              }
-              prices {
-                price {
-                  value
-                  currencyCode
-                }
-              }
-              customFields {
-                edges {
-                  node {
-                    name
-                    value
-                  }
-                }
-              }
-            }
-          }
-        }
-      }
-    }
-    """
+
+def _iter_catalog_pages() -> Iterator[List[dict]]:
+    headers = _storefront_headers()
+    if headers:
+        yield from catalog_fetcher.iter_product_pages(headers)
+
+
+def _load_catalog_data() -> List[dict]:
+    if CATALOG_SYNC_MODE == "paginated":
+        all_products = [p for page in _iter_catalog_pages() for p in page]
+        print(f"✅ Loaded {len(all_products)} products.")
+        return all_products
+
+    headers = _storefront_headers()
+    if not headers:
+        return []
 
     entity_ids = list(range(34596, 34696))  # Example range
-    all_products = []
-
-    for batch in chunked(entity_ids, 10):
-        try:
-            res = requests.post(STOREFRONT_GRAPHQL_ENDPOINT,
-                                headers=headers,
-                                json={
-                                    "query": query,
-                                    "variables": {
-                                        "entityIds": batch
-                                    }
-                                })
-            res.raise_for_status()
-            data = res.json()
-        except Exception as e:
-            print(f"❌ Error fetching batch {batch}: {e}")
-            continue
-
-        products = data.get("data", {}).get("site",
-                                            {}).get("products",
-                                                    {}).get("edges", [])
-        for edge in products:
-            node = edge.get("node", {})
-            price = ((node.get("prices") or {}).get("price")
-                     or {}).get("value")
-            currency = ((node.get("prices") or {}).get("price")
-                        or {}).get("currencyCode")
-
-            custom_fields = [
-                {
-                    "name": cf["node"]["name"],
-                    "value": cf["node"]["value"]
-                } for cf in node.get("customFields", {}).get("edges", [])
-                if cf.get("node", {}).get("name") and cf["node"].get("value")
-            ]
-
-            product = {
-                "id": node.get("entityId"),
-                "name": node.get("name"),
-                "sku": node.get("sku"),
-                "path": node.get("path"),
-                "image": (node.get("defaultImage") or {}).get("url640wide"),
-                "price": price,
-                "currency": currency,
-                "description": node.get("description", "").strip(),
-                "custom_fields": custom_fields
-            }
-            all_products.append(product)
-        sleep(0.01)
+    all_products = catalog_fetcher.fetch_by_entity_ids(entity_ids, headers)
 
     print(f"✅ Loaded {len(all_products)} products.")
     return all_products
 
 
+def _load_catalog_delta(since: float,
+                        dirty_ids: Set[int]) -> Tuple[List[dict], List[int]]:
+    """REST only tells us which products changed; their data is refetched
+    through the Storefront query used by full syncs."""
+    token = os.environ.get("BIGCOMMERCE_REST_API_TOKEN")
+    storefront_headers = _storefront_headers()
+    if not token or not storefront_headers:
+        print("❌ Catalog API tokens are missing; skipping delta.")
+        return [], []
+    headers = {"X-Auth-Token": token, "Accept": "application/json"}
+
+    modified_since = datetime.fromtimestamp(
+        since, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    changed_ids = set(
+        catalog_fetcher.fetch_rest_product_ids(
+            CATALOG_REST_PRODUCTS_URL, headers,
+            {"date_modified:min": modified_since}))
+    changed_ids |= dirty_ids
+    if not changed_ids:
+        return [], []
+
+    changed = catalog_fetcher.fetch_by_entity_ids(sorted(changed_ids),
+                                                  storefront_headers,
+                                                  raise_errors=True)
+    returned = {p["id"] for p in changed}
+    # The Storefront omits deleted and invisible products
+    removed = [pid for pid in changed_ids if pid not in returned]
+    return changed, removed
+
+
+catalog_store = CatalogStore(
+    loader=_load_catalog_data,
+    page_loader=_iter_catalog_pages
+    if CATALOG_SYNC_MODE == "paginated" else None,
+    delta_loader=_load_catalog_delta)
+
+
+async def _fetch_product_metadata(product_ids: List[int]) -> Dict[int, dict]:
+    headers = _storefront_headers()
+    if not headers:
+        return {}
+
+    async def fetch(batch: List[int]) -> List[dict]:
+        res = await post_async(STOREFRONT_GRAPHQL_ENDPOINT,
+                               json={
+                                   "query": PRODUCTS_BY_ENTITY_IDS_QUERY,
+                                   "variables": {
+                                       "entityIds": batch,
+                                       "first": len(batch)
+                                   }
+                               },
+                               headers=headers,
+                               idempotent=True)
+        edges = res.json().get("data", {}).get("site", {}).get(
+            "products", {}).get("edges", [])
+        return [normalize_product_node(edge.get("node", {})) for edge in edges]
+
+    batches = [
+        product_ids[i:i + STOREFRONT_MAX_PAGE_SIZE]
+        for i in range(0, len(product_ids), STOREFRONT_MAX_PAGE_SIZE)
+    ]
+    print(f"🔎 Fetching metadata for {len(product_ids)} uncached products...")
+    results = await asyncio.gather(*(fetch(batch) for batch in batches))
+    return {p["id"]: p for products in results for p in products}
+
+
+product_metadata = ProductMetadataCache(catalog_store.peek,
+                                        _fetch_product_metadata)
+
+
+def handle_catalog_webhook(payload: dict) -> dict:
+    """Queues the product from a `store/product/*` webhook for refresh."""
+    scope = payload.get("scope", "")
+    product_id = (payload.get("data") or {}).get("id")
+    if not scope.startswith("store/product/") or product_id is None:
+        return {"status": "ignored"}
+    catalog_store.mark_dirty([product_id])
+    product_metadata.invalidate([product_id])
+    return {"status": "queued", "product_id": product_id}
+
+
 def preload_customer_catalog(tool_context):
-    if "catalog" in tool_context.state:
-        return {"status": "already_loaded"}
-    catalog = _load_catalog_data()
-    tool_context.state["catalog"] = catalog
-    return {"status": "catalog_loaded", "count": len(catalog)}
+    # Sessions only hold the version; products stay in the shared store
+    catalog = catalog_store.get()
+    if tool_context.state.get("catalog_version") == catalog.version:
+        return {"status": "already_loaded", "version": catalog.version}
+    tool_context.state["catalog_version"] = catalog.version
+    return {
+        "status": "catalog_loaded",
+        "version": catalog.version,
+        "count": len(catalog)
+    }
+
+
+def resolve_catalog(tool_context) -> Catalog:
+    """Returns the shared catalog for the version a session references.
+
+    The pinned version is served for as long as the store retains it, so a
+    turn prices against one consistent catalog; once it is evicted the
+    session moves forward to the newest one.
+    """
+    pinned = tool_context.state.get("catalog_version")
+    if pinned:
+        catalog = catalog_store.get_version(pinned)
+        if catalog is not None:
+            return catalog
+    catalog = catalog_store.get()
+    if tool_context.state.get("catalog_version") != catalog.version:
+        tool_context.state["catalog_version"] = catalog.version
+    return catalog
 
 
 def read_catalog_from_state(tool_context: ToolContext) -> Content:
-    catalog = tool_context.state.get("catalog", [])
-    if not catalog:
+    catalog = resolve_catalog(tool_context)
+    if not len(catalog):
         return Content(role="user",
-                       parts=[Part(text="❌ No catalog in session state.")])
+                       parts=[Part(text="❌ No catalog loaded.")])
 
     lines = []
-    for product in catalog[:25]:
+    for product in catalog.products[:25]:
         lines.append(
             f"🛍️ {product['name']} (SKU: {product['sku']}) — {product['currency']} {product['price']}"
         )
@@ -148,60 +190,35 @@ def read_catalog_from_state(tool_context: ToolContext) -> Content:
     return Content(role="user", parts=[Part(text="\n".join(lines))])
 
 
-def ingest_catalog_to_memory(app_name: str, user_id: str, session_id: str):
-    catalog = _load_catalog_data()
-    events = []
-    print(f"📦 Ingesting {len(catalog)} catalog entries into memory...")
-    print(
-        f"🔑 Using app_name={app_name}, user_id={user_id}, session_id={session_id}"
-    )
-
-    for product in catalog:
-        lines = [f"{product['name']}"]
-        if product.get("sku"):
-            lines.append(f"SKU: {product['sku']}")
-        if product.get("price"):
-            lines.append(f"Price: {product['currency']} {product['price']}")
-        if product.get("custom_fields"):
-            for cf in product["custom_fields"]:
-                lines.append(f"{cf['name']}: {cf['value']}")
-        if product.get("description"):
-            lines.append(product["description"])
-
-        content = Content(role="user", parts=[Part(text="\n".join(lines))])
-        events.append(Event(author="catalog_ingest", content=content))
-
-    session = Session(id=session_id,
-                      app_name=app_name,
-                      user_id=user_id,
-                      state={},
-                      events=events)
-
-    memory_service.add_session_to_memory(session)
-    print(f"✅ Catalog ingested into memory ({len(events)} entries).")
-    return {"status": "catalog_ingested", "entries": len(events)}
-
-
 preload_customer_catalog_tool = FunctionTool(func=preload_customer_catalog)
 read_catalog_from_state_tool = FunctionTool(func=read_catalog_from_state)
 
 
-def search_catalog_memory(query: str) -> List[MemoryResult]:
-    print("🔍 [Memory Search] Searching catalog memory")
+def search_catalog_memory(query: str) -> List[dict]:
+    print("🔍 [Catalog Search] Searching catalog index")
     print(f"🔍 Query: {query}")
 
     try:
-        results = memory_service.search_memory(
-            app_name="quote_agent",
-            user_id="user",
-            query=query,
-        )
-        if results and results.memories:
-            print(f"✅ Found {len(results.memories)} matching catalog items.")
-            return results.memories
+        catalog = catalog_store.get()
+        hits = catalog.search_index.search(query, k=SEARCH_TOP_K)
+        if hits:
+            results = []
+            for product_id, score in hits:
+                product = catalog.get(product_id)
+                results.append({
+                    "product_id": product_id,
+                    "name": product["name"],
+                    "sku": product.get("sku"),
+                    "price": product.get("price"),
+                    "currency": product.get("currency"),
+                    "score": round(score, 3),
+                    "text": product_search_text(product)
+                })
+            print(f"✅ Found {len(results)} matching catalog items.")
+            return results
         print("⚠️ No results found.")
     except Exception as e:
-        print(f"❌ Memory search failed: {e}")
+        print(f"❌ Catalog search failed: {e}")
     return []
 
 
@@ -210,8 +227,7 @@ search_catalog_memory_tool = FunctionTool(func=search_catalog_memory)
 
 def get_price_by_product_id(product_id: int,
                             tool_context: ToolContext) -> dict:
-    catalog = tool_context.state.get("catalog", [])
-    product = next((p for p in catalog if p["id"] == product_id), None)
+    product = resolve_catalog(tool_context).get(product_id)
 
     if not product:
         return {
@@ -231,7 +247,9 @@ def get_price_by_product_id(product_id: int,
 get_price_by_product_id_tool = FunctionTool(func=get_price_by_product_id)
 
 __all__ = [
+    "catalog_store", "product_metadata", "resolve_catalog",
+    "handle_catalog_webhook",
     "preload_customer_catalog_tool", "read_catalog_from_state_tool",
-    "ingest_catalog_to_memory", "search_catalog_memory_tool",
+    "search_catalog_memory_tool",
     "get_price_by_product_id_tool"
 ]
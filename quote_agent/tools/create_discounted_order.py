@@ -1,105 +1,141 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from google.adk.tools import ToolContext, FunctionTool
-import requests
+import httpx
 import os
 import json
 
+from quote_agent.customer_cache import CustomerAddressCache, webhook_customer_id
+from quote_agent.http_client import CircuitOpenError, get, post_async
+from quote_agent.pricing import PricingError, price_cart
+from quote_agent.tools.catalog import resolve_catalog
+
 STORE_HASH = os.environ["BIGCOMMERCE_STORE_HASH"]
 API_TOKEN = os.environ["BIGCOMMERCE_REST_API_TOKEN"]
 ORDERS_API = f"https://api.bigcommerce.com/stores/{STORE_HASH}/v2/orders"
 CUSTOMER_API = f"https://api.bigcommerce.com/stores/{STORE_HASH}/v2/customers"
+BILLING_ADDRESS_FIELDS = {
+    "first_name", "last_name", "company", "street_1", "street_2", "city",
+    "state", "zip", "country", "country_iso2"
+}
 
 
-class ProductItem(BaseModel):
-    product_id: int
-    quantity: int
+def _headers() -> dict:
+    return {
+        "X-Auth-Token": API_TOKEN,
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
 
 
-class MultiOrderArgs(BaseModel):
-    products: List[ProductItem]
-    discount_percent: float
+def _load_billing_address(customer_id: int) -> Optional[dict]:
+    res = get(f"{CUSTOMER_API}/{customer_id}/addresses", headers=_headers())
+    res.raise_for_status()
+    # v2 answers 204 with an empty body when the customer has no addresses
+    addresses = res.json() if res.content else []
+    if not addresses:
+        return None
+    return {
+        k: v
+        for k, v in addresses[0].items() if k in BILLING_ADDRESS_FIELDS
+    }
 
 
-def _calculate_discount(products: List[ProductItem], discount_percent: float,
-                        tool_context: ToolContext) -> float:
-    catalog = tool_context.state.get("catalog", [])
-    total = 0.0
-    for item in products:
-        product = next((p for p in catalog if p["id"] == item.product_id),
-                       None)
-        if not product or product.get("price") is None:
-            raise ValueError(f"Missing price for product {item.product_id}")
-        total += float(product["price"]) * item.quantity
-    return round(total * (discount_percent / 100), 2)
+customer_addresses = CustomerAddressCache(_load_billing_address)
 
 
-def create_multi_item_discounted_order_afc(products: List[ProductItem],
-                                           discount_percent: float,
-                                           tool_context: ToolContext) -> dict:
-    headers = {
-        "X-Auth-Token": API_TOKEN,
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    customer_id = 25
+def handle_customer_webhook(payload: dict) -> dict:
+    """Drops the cached address on `store/customer/*` webhooks."""
+    customer_id = webhook_customer_id(payload)
+    if customer_id is None:
+        return {"status": "ignored"}
+    customer_addresses.invalidate(customer_id)
+    return {"status": "invalidated", "customer_id": customer_id}
 
-    try:
-        addr_res = requests.get(f"{CUSTOMER_API}/{customer_id}/addresses",
-                                headers=headers)
-        addr_res.raise_for_status()
-        addresses = addr_res.json()
-        if not addresses:
-            return {"status": "error", "message": "No billing address found"}
 
-        billing_address = {
-            k: v
-            for k, v in addresses[0].items() if k in {
-                "first_name", "last_name", "company", "street_1", "street_2",
-                "city", "state", "zip", "country", "country_iso2"
-            }
-        }
-    except Exception as e:
-        return {"status": "error", "message": f"Address fetch failed: {e}"}
+class ProductItem(BaseModel):
+    product_id: int
+    quantity: int
 
-    try:
-        discount_amount = _calculate_discount(products, discount_percent,
-                                              tool_context)
-    except Exception as e:
-        return {"status": "error", "message": f"Discount error: {e}"}
 
-    payload = {
+class MultiOrderArgs(BaseModel):
+    products: List[ProductItem]
+    discount_percent: float
+
+
+def build_order_payload(products: List[ProductItem],
+                        discount_percent: float,
+                        catalog,
+                        billing_address: dict,
+                        customer_id: int,
+                        pricing: Optional[dict] = None) -> dict:
+    if pricing is None:
+        pricing = price_cart([(item.product_id, item.quantity)
+                              for item in products], discount_percent,
+                             catalog)
+    if pricing["route"] != "order":
+        raise PricingError(
+            f"A {pricing['applied_discount_percent']}% discount needs "
+            "approval; create a quote instead.")
+    return {
         "status_id": 2,
         "channel_id": 1,
         "customer_id": customer_id,
         "billing_address": billing_address,
         "products": [item.dict() for item in products],
-        "discount_amount": str(discount_amount),
+        "discount_amount": str(pricing["discount"]),
         "default_currency_code": "GBP"
     }
 
-    print("📤 Payload:\n", json.dumps(payload, indent=2))
+
+async def submit_order(payload: dict) -> dict:
     res = None
     try:
-        res = requests.post(ORDERS_API, headers=headers, json=payload)
+        res = await post_async(ORDERS_API, headers=_headers(), json=payload)
         res.raise_for_status()
-        order = res.json()
-        tool_context.state["last_order_created"] = order
-        return {
-            "status": "success",
-            "order_id": order["id"],
-            "total": order.get("total_inc_tax"),
-            "label": f"AI Negotiation Discount ({discount_percent:.0f}%)"
-        }
-    except requests.RequestException as e:
+        return {"status": "success", "order": res.json()}
+    except (httpx.HTTPError, CircuitOpenError) as e:
         return {
             "status": "error",
             "message": str(e),
-            "raw_response": res.text if res else "No response"
+            "raw_response": res.text if res is not None else "No response"
         }
 
 
-def create_multi_item_discounted_order_wrapper(
+async def create_multi_item_discounted_order_afc(
+        products: List[ProductItem], discount_percent: float,
+        tool_context: ToolContext) -> dict:
+    customer_id = 25
+
+    try:
+        billing_address = await customer_addresses.get_async(customer_id)
+        if not billing_address:
+            return {"status": "error", "message": "No billing address found"}
+    except Exception as e:
+        return {"status": "error", "message": f"Address fetch failed: {e}"}
+
+    try:
+        payload = build_order_payload(products, discount_percent,
+                                      resolve_catalog(tool_context),
+                                      billing_address, customer_id)
+    except Exception as e:
+        return {"status": "error", "message": f"Discount error: {e}"}
+
+    print("📤 Payload:\n", json.dumps(payload, indent=2))
+    result = await submit_order(payload)
+    if result["status"] != "success":
+        return result
+    order = result["order"]
+    tool_context.state["last_order_created"] = order
+    return {
+        "status": "success",
+        "order_id": order["id"],
+        "total": order.get("total_inc_tax"),
+        "label": f"AI Negotiation Discount ({discount_percent:.0f}%)"
+    }
+
+
+async def create_multi_item_discounted_order_wrapper(
         products: List[dict], discount_percent: float,
         tool_context: ToolContext) -> dict:
     try:
@@ -108,7 +144,7 @@ def create_multi_item_discounted_order_wrapper(
     except Exception as e:
         return {"status": "error", "message": f"Invalid input: {e}"}
 
-    return create_multi_item_discounted_order_afc(
+    return await create_multi_item_discounted_order_afc(
         products=parsed.products,
         discount_percent=parsed.discount_percent,
         tool_context=tool_context,
@@ -118,4 +154,7 @@ def create_multi_item_discounted_order_wrapper(
 create_multi_item_discounted_order_tool = FunctionTool(
     func=create_multi_item_discounted_order_wrapper)
 
-__all__ = ["create_multi_item_discounted_order_tool"]
+__all__ = [
+    "customer_addresses", "handle_customer_webhook",
+    "create_multi_item_discounted_order_tool"
+]
@@ -1,10 +1,14 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from google.adk.tools import ToolContext, FunctionTool
-import requests
+import httpx
 import os
 import json
 
+from quote_agent.http_client import CircuitOpenError, post_async
+from quote_agent.pricing import price_cart
+from quote_agent.tools.catalog import resolve_catalog
+
 B2B_QUOTE_API = "https://api-b2b.bigcommerce.com/api/v3/io/rfq"
 AUTH_TOKEN = os.environ["B2B_REST_API_TOKEN"]
 STORE_HASH = os.environ["BIGCOMMERCE_STORE_HASH"]
@@ -21,75 +25,66 @@ class CombinedQuoteArgs(BaseModel):
     discount_percent: float
 
 
-def create_combined_quote_request_tool_func(products: List[dict], note: str,
-                                            discount_percent: float,
-                                            tool_context: ToolContext) -> dict:
-    # manually create model
-    try:
-        args = CombinedQuoteArgs(
-            products=[ProductInput(**p) for p in products],
-            note=note,
-            discount_percent=discount_percent)
-    except Exception as e:
-        return {"status": "error", "message": f"Invalid input format: {e}"}
+class QuoteAccount(BaseModel):
+    """B2B company, buyer and contact a quote is filed under."""
+    company_id: int
+    user_email: str
+    contact_name: str
+    contact_email: str
+    contact_company: str
+    contact_phone: str
+
+
+DEFAULT_QUOTE_ACCOUNT = QuoteAccount(company_id=2164075,
+                                     user_email="liam.hartman@suppliesco.com",
+                                     contact_name="Sophie Randle",
+                                     contact_email="admin@mkmechanical.co.uk",
+                                     contact_company="MK Mechanical Solutions",
+                                     contact_phone="0123456789")
 
-    catalog = tool_context.state.get("catalog", [])
-    product_list = []
-    subtotal = 0.0
-    total_discount = 0.0
-
-    for entry in args.products:
-        product_id = entry.product_id
-        quantity = entry.quantity
-        product = next((p for p in catalog if p["id"] == product_id), None)
-
-        if not product:
-            return {
-                "status": "error",
-                "message": f"Product {product_id} not found in catalog."
-            }
-        if not product.get("price"):
-            return {
-                "status": "error",
-                "message": f"Product {product_id} missing price."
-            }
-
-        base_price = float(product["price"])
-        discount_amount = round(base_price * (args.discount_percent / 100), 2)
-        offered_price = round(base_price - discount_amount, 2)
-        line_subtotal = base_price * quantity
-        line_discount = discount_amount * quantity
-
-        subtotal += line_subtotal
-        total_discount += line_discount
 
+def build_quote_payload(args: CombinedQuoteArgs,
+                        catalog,
+                        pricing: Optional[dict] = None,
+                        account: QuoteAccount = DEFAULT_QUOTE_ACCOUNT
+                        ) -> dict:
+    """Builds the quote from `pricing`, pricing the cart first if needed.
+
+    Raises ValueError (PricingError) if the cart can't be priced.
+    """
+    if pricing is None:
+        pricing = price_cart([(p.product_id, p.quantity)
+                              for p in args.products], args.discount_percent,
+                             catalog)
+
+    product_list = []
+    for line in pricing["lines"]:
+        product = catalog.get(line["product_id"])
         product_list.append({
-            "productId": product_id,
+            "productId": line["product_id"],
             #"variantId": product_id,
-            "quantity": quantity,
-            "basePrice": str(base_price),
-            "discount": str(discount_amount),
-            "offeredPrice": str(offered_price),
+            "quantity": line["quantity"],
+            "basePrice": str(line["unit_price"]),
+            "discount": str(line["unit_discount"]),
+            "offeredPrice": str(line["offered_price"]),
             "sku": product.get("sku"),
             "productName": product.get("name"),
             "imageUrl": product.get("image"),
             "options": []
         })
 
-    grand_total = round(subtotal - total_discount, 2)
-
-    payload = {
+    return {
         "notes": args.note,
         "quoteTitle": "Agent Quote: Bundle Request",
         "referenceNumber": "bundle_quote_request",
         "expiredAt": "12/31/2025",
         "legalTerms":
         "Quote valid for 30 days. Net 30 terms. FOB shipping point.",
-        "subtotal": round(subtotal, 2),
-        "discount": round(total_discount, 2),
-        "grandTotal": grand_total,
-        "userEmail": "liam.hartman@suppliesco.com",
-        "companyId": 2164075,
+        "subtotal": float(pricing["subtotal"]),
+        "discount": float(pricing["discount"]),
+        "grandTotal": float(pricing["grand_total"]),
+        "userEmail": account.user_email,
+        "companyId": account.company_id,
         "storeHash": STORE_HASH,
         "currency": {
             "token": "£",
@@ -100,10 +95,10 @@ def create_combined_quote_request_tool_func(products: List[dict], note: str,
             "thousandsToken": ","
         },
         "contactInfo": {
-            "name": "Sophie Randle",
-            "email": "admin@mkmechanical.co.uk",
-            "companyName": "MK Mechanical Solutions",
-            "phoneNumber": "0123456789"
+            "name": account.contact_name,
+            "email": account.contact_email,
+            "companyName": account.contact_company,
+            "phoneNumber": account.contact_phone
         },
         "channelId": 1,
         "productList": product_list,
@@ -113,23 +108,48 @@ def create_combined_quote_request_tool_func(products: List[dict], note: str,
         "allowCheckout": False
     }
 
+
+async def submit_quote(payload: dict) -> dict:
     headers = {"Content-Type": "application/json", "authToken": AUTH_TOKEN}
     response = None
     try:
-        print("📤 Sending combined quote creation payload:")
-        print(json.dumps(payload, indent=2))
-        response = requests.post(B2B_QUOTE_API, headers=headers, json=payload)
+        response = await post_async(B2B_QUOTE_API,
+                                    headers=headers,
+                                    json=payload)
         print("📥 Quote API response:")
         print(response.status_code, response.text)
         response.raise_for_status()
         return {"status": "success", "response": response.json()}
-    except requests.RequestException as e:
+    except (httpx.HTTPError, CircuitOpenError) as e:
         return {
             "status": "error",
             "message": str(e),
-            "details": response.text if response else "No response returned"
+            "details": response.text
+            if response is not None else "No response returned"
         }
 
 
+async def create_combined_quote_request_tool_func(
+        products: List[dict], note: str, discount_percent: float,
+        tool_context: ToolContext) -> dict:
+    # manually create model
+    try:
+        args = CombinedQuoteArgs(
+            products=[ProductInput(**p) for p in products],
+            note=note,
+            discount_percent=discount_percent)
+    except Exception as e:
+        return {"status": "error", "message": f"Invalid input format: {e}"}
+
+    try:
+        payload = build_quote_payload(args, resolve_catalog(tool_context))
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    print("📤 Sending combined quote creation payload:")
+    print(json.dumps(payload, indent=2))
+    return await submit_quote(payload)
+
+
 create_combined_quote_request_tool = FunctionTool(
     func=create_combined_quote_request_tool_func)
@@ -0,0 +1,85 @@
+from typing import List
+from pydantic import BaseModel
+from google.adk.tools import ToolContext, FunctionTool
+import os
+
+from quote_agent.pricing import price_carts
+from quote_agent.tools.catalog import resolve_catalog
+from quote_agent.tools.create_quote import ProductInput
+
+SIMULATION_MAX_SCENARIOS = int(
+    os.environ.get("SIMULATION_MAX_SCENARIOS", "500"))
+
+
+class SimulationArgs(BaseModel):
+    products: List[ProductInput]
+    discount_percents: List[float]
+    quantity_breaks: List[int]
+
+
+def simulate_discount_scenarios(products: List[dict],
+                                discount_percents: List[float],
+                                quantity_breaks: List[int],
+                                tool_context: ToolContext) -> dict:
+    """Prices a cart under every discount × quantity-break combination.
+
+    Each quantity break sets every line to that many units; the cart's own
+    quantities are always included as the baseline. All scenarios are
+    priced in one batched pass.
+    """
+    try:
+        args = SimulationArgs(products=[ProductInput(**p) for p in products],
+                              discount_percents=discount_percents,
+                              quantity_breaks=quantity_breaks)
+    except Exception as e:
+        return {"status": "error", "message": f"Invalid input: {e}"}
+    if not args.products or not args.discount_percents:
+        return {
+            "status": "error",
+            "message": "Provide at least one product and one discount."
+        }
+
+    breaks = [None] + sorted({q for q in args.quantity_breaks if q > 0})
+    grid = [(percent, quantity) for quantity in breaks
+            for percent in args.discount_percents]
+    if len(grid) > SIMULATION_MAX_SCENARIOS:
+        return {
+            "status": "error",
+            "message": f"{len(grid)} scenarios requested; the limit is "
+            f"{SIMULATION_MAX_SCENARIOS}."
+        }
+
+    carts = [[(p.product_id, quantity or p.quantity) for p in args.products]
+             for _, quantity in grid]
+    pricings = price_carts(carts, [percent for percent, _ in grid],
+                           resolve_catalog(tool_context))
+    if "error" in pricings[0]:
+        return {"status": "error", "message": pricings[0]["error"]}
+
+    scenarios = [{
+        "discount_percent": percent,
+        "quantity_break": quantity,
+        "subtotal": float(pricing["subtotal"]),
+        "discount": float(pricing["discount"]),
+        "grand_total": float(pricing["grand_total"]),
+        "applied_discount_percent": pricing["applied_discount_percent"],
+        "effective_discount_percent": pricing["effective_discount_percent"],
+        "route": pricing["route"]
+    } for (percent, quantity), pricing in zip(grid, pricings)]
+
+    order_discounts = [
+        s["discount_percent"] for s in scenarios
+        if s["route"] == "order" and s["quantity_break"] is None
+    ]
+    return {
+        "status": "success",
+        "currency": "GBP",
+        "scenarios": scenarios,
+        "max_order_discount_percent": max(order_discounts, default=None)
+    }
+
+
+simulate_discount_scenarios_tool = FunctionTool(
+    func=simulate_discount_scenarios)
+
+__all__ = ["simulate_discount_scenarios_tool"]
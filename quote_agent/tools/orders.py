@@ -1,18 +1,37 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from google.adk.tools import ToolContext, FunctionTool
-from google.adk.agents.callback_context import CallbackContext
 from google.genai.types import Content, Part
-import requests
+import asyncio
 import os
 import re
 from datetime import datetime
 from email.utils import format_datetime
 
+from quote_agent.http_client import post, post_async
+from quote_agent.order_store import (CompanyOrderHistory, OrderHistoryStore,
+                                     OrderLookupLimitReached, order_id)
+from quote_agent.token_manager import (call_with_token, call_with_token_async,
+                                       check_token_response)
+from quote_agent.tools.catalog import product_metadata
+
 B2B_GRAPHQL_ENDPOINT = "https://api-b2b.bigcommerce.com/graphql"
-STOREFRONT_GRAPHQL_ENDPOINT = f"https://store-{os.environ['BIGCOMMERCE_STORE_HASH']}.mybigcommerce.com/graphql"
+COMPANY_ID = 2164075
+
+
+def _auth_headers(token: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}"
+    }
 
 
-def get_last_order(tool_context: ToolContext) -> Dict:
+def _keep_token(tool_context, token: str):
+    # A rejected token may have been renewed during the call
+    if tool_context.state.get("b2b_storefront_token") != token:
+        tool_context.state["b2b_storefront_token"] = token
+
+
+async def get_last_order(tool_context: ToolContext) -> Dict:
     token = tool_context.state.get("b2b_storefront_token")
     if not token:
         return {
@@ -20,44 +39,14 @@ def get_last_order(tool_context: ToolContext) -> Dict:
             "error_message": "Missing B2B storefront token in state."
         }
 
-    company_id = 2164075
-    query = """
-    query GetOrders($companyId: Int!) {
-      allOrders(companyIds: [$companyId], first: 1, orderBy: "-bcOrderId") {
-        edges {
-          node {
-            orderId
-            createdAt
-            totalIncTax
-            currencyCode
-            status
-            poNumber
-            companyInfo { companyName }
-          }
-        }
-      }
-    }
-    """
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-
     try:
-        res = requests.post(B2B_GRAPHQL_ENDPOINT,
-                            json={
-                                "query": query,
-                                "variables": {
-                                    "companyId": company_id
-                                }
-                            },
-                            headers=headers)
-        data = res.json()
-        if "errors" in data:
-            return {"status": "error", "error_message": str(data["errors"])}
-        order = data["data"]["allOrders"]["edges"][0]["node"]
-        tool_context.state["last_order"] = order
+        history, token = await asyncio.to_thread(
+            call_with_token, token, lambda t: order_store.get(COMPANY_ID, t))
+        _keep_token(tool_context, token)
+        order = history.last()
+        if order is None:
+            return {"status": "error", "error_message": "No orders found."}
+        tool_context.state["last_order"] = dict(order)
         dt = datetime.utcfromtimestamp(int(order["createdAt"]))
         return {
             "status": "success",
@@ -67,7 +56,8 @@ def get_last_order(tool_context: ToolContext) -> Dict:
                 "totalIncTax": order["totalIncTax"],
                 "status": order["status"],
                 "poNumber": order.get("poNumber"),
-                "companyName": order.get("companyInfo", {}).get("companyName"),
+                "companyName": (order.get("companyInfo")
+                                or {}).get("companyName"),
                 "currencyCode": order["currencyCode"]
             }
         }
@@ -78,7 +68,22 @@ def get_last_order(tool_context: ToolContext) -> Dict:
 get_last_order_tool = FunctionTool(func=get_last_order)
 
 
-def get_order_products(tool_context: ToolContext) -> Content:
+def _order_line_parts(prefix: str, pid: int,
+                      metadata: Dict[int, dict]) -> List[Part]:
+    meta = metadata.get(pid, {})
+    name = meta.get("name") or f"Product {pid}"
+    value = meta.get("price")
+    currency = meta.get("currency") or ""
+    parts = [
+        Part(text=f"{prefix} {name} — {currency} "
+             f"{value if value is not None else '??'}")
+    ]
+    if meta.get("image"):
+        parts.append(Part(text=f"🖼️ Image: {meta['image']}"))
+    return parts
+
+
+async def get_order_products(tool_context: ToolContext) -> Content:
     token = tool_context.state.get("b2b_storefront_token")
     if not token:
         return Content(
@@ -106,20 +111,22 @@ def get_order_products(tool_context: ToolContext) -> Content:
     }
     """
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    async def fetch(token: str):
+        res = await post_async(B2B_GRAPHQL_ENDPOINT,
+                               json={
+                                   "query": query,
+                                   "variables": {
+                                       "bcOrderId": int(order_id)
+                                   }
+                               },
+                               headers=_auth_headers(token),
+                               idempotent=True)
+        check_token_response(res)
+        return res
 
     try:
-        res = requests.post(B2B_GRAPHQL_ENDPOINT,
-                            json={
-                                "query": query,
-                                "variables": {
-                                    "bcOrderId": int(order_id)
-                                }
-                            },
-                            headers=headers)
+        res, token = await call_with_token_async(token, fetch)
+        _keep_token(tool_context, token)
         data = res.json()
         products = data.get("data", {}).get("orderProducts", [])
         if not products:
@@ -129,42 +136,13 @@ def get_order_products(tool_context: ToolContext) -> Content:
         product_ids = [
             int(p["productId"]) for p in products if p.get("productId")
         ]
-        fragments = [
-            f"""
-            p{pid}: product(entityId: {pid}) {{
-              name
-              defaultImage {{ url640wide: url(width: 640) }}
-              prices {{ price {{ value currencyCode }} }}
-            }}
-        """ for pid in product_ids
-        ]
-
-        sf_headers = {
-            "Content-Type":
-            "application/json",
-            "Authorization":
-            f"Bearer {os.environ['BIGCOMMERCE_STOREFRONT_API_TOKEN']}"
-        }
-
-        res_sf = requests.post(
-            STOREFRONT_GRAPHQL_ENDPOINT,
-            json={"query": f"query {{ site {{ {' '.join(fragments)} }} }}"},
-            headers=sf_headers)
-        metadata = res_sf.json().get("data", {}).get("site", {})
+        metadata = await product_metadata.get_many(product_ids)
 
         parts = []
         for p in products:
             pid = int(p["productId"])
-            meta = metadata.get(f"p{pid}", {})
-            name = meta.get("name", f"Product {pid}")
             qty = p.get("quantity")
-            image = (meta.get("defaultImage") or {}).get("url640wide")
-            price = (meta.get("prices") or {}).get("price", {})
-            value = price.get("value", "??")
-            currency = price.get("currencyCode", "")
-            parts.append(Part(text=f"🛒 {qty}x {name} — {currency} {value}"))
-            if image:
-                parts.append(Part(text=f"🖼️ Image: {image}"))
+            parts.extend(_order_line_parts(f"🛒 {qty}x", pid, metadata))
 
         return Content(role="user", parts=parts)
 
@@ -175,84 +153,156 @@ def get_order_products(tool_context: ToolContext) -> Content:
 get_order_products_tool = FunctionTool(func=get_order_products)
 
 
-def get_order_products_by_ids(order_ids: List[int],
-                              tool_context: ToolContext) -> Content:
+ORDER_PRODUCTS_BATCH_SIZE = int(
+    os.environ.get("ORDER_PRODUCTS_BATCH_SIZE", "25"))
+ORDER_PRODUCTS_CONCURRENCY = int(
+    os.environ.get("ORDER_PRODUCTS_CONCURRENCY", "5"))
+ORDER_PRODUCTS_QUERY = """
+query GetOrderProducts($bcOrderId: Int!) {
+  orderProducts(bcOrderId: $bcOrderId) {
+    quantity
+    productId
+    variantId
+  }
+}
+"""
+
+
+async def _fetch_order_products_single(
+        order_ids: List[int], headers: dict) -> Dict[int, List[dict]]:
+    """Fallback: one request per order, run concurrently with a bound."""
+    semaphore = asyncio.Semaphore(ORDER_PRODUCTS_CONCURRENCY)
+
+    async def fetch(oid: int):
+        async with semaphore:
+            res = await post_async(B2B_GRAPHQL_ENDPOINT,
+                                   json={
+                                       "query": ORDER_PRODUCTS_QUERY,
+                                       "variables": {
+                                           "bcOrderId": oid
+                                       }
+                                   },
+                                   headers=headers,
+                                   idempotent=True)
+        check_token_response(res)
+        return oid, res.json().get("data", {}).get("orderProducts") or []
+
+    return dict(await asyncio.gather(*(fetch(oid) for oid in order_ids)))
+
+
+def _order_products_document(order_ids: List[int]) -> str:
+    fields = " ".join(
+        f"o{oid}: orderProducts(bcOrderId: {oid}) "
+        "{ quantity productId variantId }" for oid in order_ids)
+    return f"query {{ {fields} }}"
+
+
+def _parse_order_products(body: dict,
+                          order_ids: List[int]) -> Optional[Dict[int, List[dict]]]:
+    data = body.get("data") or {}
+    if body.get("errors") or any(f"o{oid}" not in data for oid in order_ids):
+        # The server rejected the aliased document (e.g. complexity limits)
+        print(f"⚠️ Batched orderProducts failed, falling back to "
+              f"per-order requests: {body.get('errors')}")
+        return None
+    return {oid: data[f"o{oid}"] or [] for oid in order_ids}
+
+
+async def _fetch_order_products_batch(
+        order_ids: List[int], headers: dict) -> Dict[int, List[dict]]:
+    res = await post_async(B2B_GRAPHQL_ENDPOINT,
+                           json={"query": _order_products_document(order_ids)},
+                           headers=headers,
+                           idempotent=True)
+    check_token_response(res)
+    parsed = _parse_order_products(res.json(), order_ids)
+    if parsed is None:
+        return await _fetch_order_products_single(order_ids, headers)
+    return parsed
+
+
+def load_order_lines(order_ids: List[int],
+                     token: str) -> Dict[int, List[dict]]:
+    """Blocking batched `orderProducts` lookup for background jobs."""
+    headers = _auth_headers(token)
+    order_ids = list(dict.fromkeys(int(oid) for oid in order_ids))
+    results: Dict[int, List[dict]] = {}
+    for i in range(0, len(order_ids), ORDER_PRODUCTS_BATCH_SIZE):
+        chunk = order_ids[i:i + ORDER_PRODUCTS_BATCH_SIZE]
+        res = post(B2B_GRAPHQL_ENDPOINT,
+                   json={"query": _order_products_document(chunk)},
+                   headers=headers,
+                   idempotent=True)
+        check_token_response(res)
+        parsed = _parse_order_products(res.json(), chunk)
+        if parsed is None:
+            parsed = {}
+            for oid in chunk:
+                single = post(B2B_GRAPHQL_ENDPOINT,
+                              json={
+                                  "query": ORDER_PRODUCTS_QUERY,
+                                  "variables": {
+                                      "bcOrderId": oid
+                                  }
+                              },
+                              headers=headers,
+                              idempotent=True)
+                check_token_response(single)
+                parsed[oid] = single.json().get("data",
+                                                {}).get("orderProducts") or []
+        results.update(parsed)
+    return results
+
+
+async def _fetch_order_products(order_ids: List[int],
+                                headers: dict) -> Dict[int, List[dict]]:
+    """Fetches the lines of many orders as aliased `orderProducts` fields.
+
+    Each chunk of ORDER_PRODUCTS_BATCH_SIZE orders is one GraphQL document,
+    so a typical multi-order lookup costs a single round-trip.
+    """
+    order_ids = list(dict.fromkeys(int(oid) for oid in order_ids))
+    chunks = [
+        order_ids[i:i + ORDER_PRODUCTS_BATCH_SIZE]
+        for i in range(0, len(order_ids), ORDER_PRODUCTS_BATCH_SIZE)
+    ]
+    results: Dict[int, List[dict]] = {}
+    for chunk_result in await asyncio.gather(
+            *(_fetch_order_products_batch(chunk, headers)
+              for chunk in chunks)):
+        results.update(chunk_result)
+    return results
+
+
+async def get_order_products_by_ids(order_ids: List[int],
+                                    tool_context: ToolContext) -> Content:
     token = tool_context.state.get("b2b_storefront_token")
     if not token:
         return Content(
             role="user",
             parts=[Part(text="❌ Missing B2B token in session state.")])
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-
+    products_by_order, token = await call_with_token_async(
+        token, lambda t: _fetch_order_products(order_ids, _auth_headers(t)))
+    _keep_token(tool_context, token)
     all_products = []
     storefront_ids = set()
-
-    for oid in order_ids:
-        query = """
-        query GetOrderProducts($bcOrderId: Int!) {
-          orderProducts(bcOrderId: $bcOrderId) {
-            quantity
-            productId
-            variantId
-          }
-        }
-        """
-        res = requests.post(B2B_GRAPHQL_ENDPOINT,
-                            json={
-                                "query": query,
-                                "variables": {
-                                    "bcOrderId": oid
-                                }
-                            },
-                            headers=headers)
-        data = res.json().get("data", {}).get("orderProducts", [])
-        for p in data:
+    for oid in dict.fromkeys(int(oid) for oid in order_ids):
+        for p in products_by_order.get(oid, []):
             p["orderId"] = oid
             all_products.append(p)
             if p.get("productId"):
                 storefront_ids.add(int(p["productId"]))
 
-    fragments = [
-        f"""
-        p{pid}: product(entityId: {pid}) {{
-          name
-          defaultImage {{ url640wide: url(width: 640) }}
-          prices {{ price {{ value currencyCode }} }}
-        }}
-    """ for pid in storefront_ids
-    ]
-
-    res_sf = requests.post(
-        STOREFRONT_GRAPHQL_ENDPOINT,
-        json={"query": f"query {{ site {{ {' '.join(fragments)} }} }}"},
-        headers={
-            "Content-Type":
-            "application/json",
-            "Authorization":
-            f"Bearer {os.environ['BIGCOMMERCE_STOREFRONT_API_TOKEN']}"
-        })
-    metadata = res_sf.json().get("data", {}).get("site", {})
+    metadata = await product_metadata.get_many(storefront_ids)
 
     parts = []
     for p in all_products:
         pid = int(p["productId"])
-        meta = metadata.get(f"p{pid}", {})
-        name = meta.get("name", f"Product {pid}")
         qty = p.get("quantity")
-        image = (meta.get("defaultImage") or {}).get("url640wide")
-        price = (meta.get("prices") or {}).get("price", {})
-        value = price.get("value", "??")
-        currency = price.get("currencyCode", "")
-        parts.append(
-            Part(text=
-                 f"📦 Order #{p['orderId']}: {qty}x {name} — {currency} {value}"
-                 ))
-        if image:
-            parts.append(Part(text=f"🖼️ Image: {image}"))
+        parts.extend(
+            _order_line_parts(f"📦 Order #{p['orderId']}: {qty}x", pid,
+                              metadata))
 
     return Content(role="user",
                    parts=parts or [Part(text="No products found.")])
@@ -261,78 +311,125 @@ def get_order_products_by_ids(order_ids: List[int],
 get_order_products_by_ids_tool = FunctionTool(func=get_order_products_by_ids)
 
 
-def get_order_history(tool_context: CallbackContext) -> Dict:
-    token = tool_context.state.get("b2b_storefront_token")
-    if not token:
-        return {
-            "status": "error",
-            "error_message": "Missing B2B token in state."
-        }
-
-    company_id = 2164075
-    query = """
-    query GetOrderHistory($companyId: Int!) {
-      allOrders(
-        companyIds: [$companyId]
-        first: 10
-        orderBy: "-bcOrderId"
-      ) {
-        edges {
-          node {
-            orderId
-            createdAt
-            totalIncTax
-            currencyCode
-            status
-          }
-        }
+ORDER_HISTORY_QUERY = """
+query GetOrderHistory($companyId: Int!, $first: Int!, $after: String) {
+  allOrders(
+    companyIds: [$companyId]
+    first: $first
+    after: $after
+    orderBy: "-bcOrderId"
+  ) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    edges {
+      node {
+        orderId
+        createdAt
+        totalIncTax
+        currencyCode
+        status
+        poNumber
+        companyInfo { companyName }
       }
     }
-    """
+  }
+}
+"""
+# Orders summarised into session state by the order history tools
+ORDER_HISTORY_STATE_SIZE = 10
+# Upper bound on orders a single "all"/"last N" request may load
+ORDER_RESOLVE_MAX_ORDERS = int(
+    os.environ.get("ORDER_RESOLVE_MAX_ORDERS", "200"))
+_ALL_ORDERS_RE = re.compile(r"\ball\b")
+
+
+def _load_order_page(company_id: int, token: str, after: Optional[str],
+                     first: int) -> Tuple[List[dict], Optional[str]]:
+    res = post(B2B_GRAPHQL_ENDPOINT,
+               json={
+                   "query": ORDER_HISTORY_QUERY,
+                   "variables": {
+                       "companyId": company_id,
+                       "first": first,
+                       "after": after
+                   }
+               },
+               headers=_auth_headers(token),
+               idempotent=True)
+    check_token_response(res)
+    res.raise_for_status()
+    data = res.json()
+    if "errors" in data:
+        raise RuntimeError(str(data["errors"]))
+    connection = data["data"]["allOrders"]
+    page_info = connection.get("pageInfo") or {}
+    orders = [edge["node"] for edge in connection.get("edges", [])]
+    cursor = page_info.get("endCursor") if page_info.get(
+        "hasNextPage") else None
+    return orders, cursor
+
+
+order_store = OrderHistoryStore(_load_order_page)
+
+
+def _format_order_date(order: dict) -> dict:
+    # Store entries are shared across sessions, so format a copy
+    order = dict(order)
+    try:
+        dt = datetime.utcfromtimestamp(int(order["createdAt"]))
+        order["createdAt"] = format_datetime(dt)
+    except Exception:
+        pass
+    return order
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
+
+def _order_history_state(history: CompanyOrderHistory) -> List[dict]:
+    return [
+        _format_order_date(o)
+        for o in history.recent(ORDER_HISTORY_STATE_SIZE)
+    ]
+
+
+def _store_order_history(history: CompanyOrderHistory, tool_context) -> Dict:
+    orders = _order_history_state(history)
+    if not orders:
+        return {"status": "not_found", "message": "No recent orders found."}
+
+    tool_context.state["order_history"] = orders
+    summary = "\n".join(
+        f"- Order #{o['orderId']} on {o['createdAt']} • {o['currencyCode']} {o['totalIncTax']} • {o['status']}"
+        for o in orders)
+    return {
+        "status": "success",
+        "orders_count": len(orders),
+        "summary": summary
     }
 
-    try:
-        res = requests.post(B2B_GRAPHQL_ENDPOINT,
-                            json={
-                                "query": query,
-                                "variables": {
-                                    "companyId": company_id
-                                }
-                            },
-                            headers=headers)
-        data = res.json()
-        orders = [
-            edge["node"]
-            for edge in data.get("data", {}).get("allOrders", {}).get(
-                "edges", [])
-        ]
-        if not orders:
-            return {
-                "status": "not_found",
-                "message": "No recent orders found."
-            }
 
-        for o in orders:
-            try:
-                ts = int(o["createdAt"])
-                dt = datetime.utcfromtimestamp(ts)
-                o["createdAt"] = format_datetime(dt)
-            except Exception:
-                pass
-
-        tool_context.state["order_history"] = orders
-        summary = "\n".join(
-            f"- Order #{o['orderId']} on {o['createdAt']} • {o['currencyCode']} {o['totalIncTax']} • {o['status']}"
-            for o in orders)
+def load_order_history(token: str) -> List[dict]:
+    """Blocking loader for the recent orders kept in `order_history` state.
+
+    It returns the orders rather than writing state, so callbacks can run
+    it off-thread and apply the result themselves.
+    """
+    return _order_history_state(order_store.get(COMPANY_ID, token))
+
+
+async def get_order_history(tool_context: ToolContext) -> Dict:
+    token = tool_context.state.get("b2b_storefront_token")
+    if not token:
         return {
-            "status": "success",
-            "orders_count": len(orders),
-            "summary": summary
+            "status": "error",
+            "error_message": "Missing B2B token in state."
         }
+
+    try:
+        history, token = await asyncio.to_thread(
+            call_with_token, token, lambda t: order_store.get(COMPANY_ID, t))
+        _keep_token(tool_context, token)
+        return _store_order_history(history, tool_context)
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
@@ -358,13 +455,59 @@ def read_order_history_from_state(tool_context: ToolContext) -> Content:
 resolve_order_ids_tool = FunctionTool(func=read_order_history_from_state)
 
 
-def resolve_order_ids_from_input(input_text: str,
-                                 tool_context: ToolContext) -> Optional[dict]:
+def _resolve_order_ids(input_text: str, token: str) -> dict:
+    # Only the pages each request needs are loaded from the order store
+    if _ALL_ORDERS_RE.search(input_text):
+        orders = order_store.recent(COMPANY_ID, token,
+                                    ORDER_RESOLVE_MAX_ORDERS)
+        return {"order_ids": [order_id(o) for o in orders]}
+
+    match = re.search(r"last\s+(\d+)", input_text)
+    if match:
+        count = min(int(match.group(1)), ORDER_RESOLVE_MAX_ORDERS)
+        orders = order_store.recent(COMPANY_ID, token, count)
+        return {"order_ids": [order_id(o) for o in orders]}
+
+    try:
+        match = re.search(r"orders?\s+(\d+)\s*[-to]+\s*(\d+)", input_text)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            orders = order_store.in_range(COMPANY_ID, token, start, end)
+            return {"order_ids": [order_id(o) for o in orders]}
+
+        ids = {int(num) for num in re.findall(r"\d+", input_text)}
+        if not ids:
+            return {"order_ids": []}
+        orders = order_store.find(COMPANY_ID, token, ids)
+        return {"order_ids": [order_id(o) for o in orders]}
+    except OrderLookupLimitReached as e:
+        return {
+            "order_ids": [order_id(o) for o in e.orders],
+            "status": "partial",
+            "message": f"Only the newest {e.scanned} orders were searched. "
+            "Ask the user to confirm the order numbers or narrow the range."
+        }
+
+
+async def resolve_order_ids_from_input(input_text: str,
+                                       tool_context: ToolContext
+                                       ) -> Optional[dict]:
+    input_text = input_text.lower()
+    token = tool_context.state.get("b2b_storefront_token")
+    if token:
+        try:
+            result, token = await asyncio.to_thread(
+                call_with_token, token,
+                lambda t: _resolve_order_ids(input_text, t))
+            _keep_token(tool_context, token)
+            return result
+        except Exception as e:
+            print(f"⚠️ Order history lookup failed, using session state: {e}")
+
     history = tool_context.state.get("order_history", [])
     all_ids = [int(o["orderId"]) for o in history]
-    input_text = input_text.lower()
 
-    if "all" in input_text:
+    if _ALL_ORDERS_RE.search(input_text):
         return {"order_ids": all_ids}
 
     match = re.search(r"last\s+(\d+)", input_text)